@@ -8,8 +8,28 @@ from utils.gmsc_genes import genes
 
 
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate AMPSphere resources')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='number of processes used to calculate AMP features')
+    parser.add_argument('--partitions',
+                        type=int,
+                        default=1,
+                        help='number of temporary files used to count GMSC '
+                             'predictions (more partitions, less memory)')
+    parser.add_argument('--alphabet',
+                        choices=['8', '10', '12'],
+                        default='8',
+                        help='reduced alphabet (number of letters) used to '
+                             'cluster AMPs')
+    args = parser.parse_args()
+
     print('From prediction to families')
-    run_pipe()
+    run_pipe(partitions=args.partitions,
+             alphabet=args.alphabet)
     print('Add progenomes genes')
     ampsphere2progenomes()
     print('Annotate metagenomes')
@@ -19,7 +39,7 @@ def main():
     print('Annotation with DRAMP')
     dramp_anno()
     print('Calculating AMP features')
-    calc_features()
+    calc_features(workers=args.workers)
     print('Processing clusters')
     process_cluster()
 
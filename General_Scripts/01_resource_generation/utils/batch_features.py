@@ -0,0 +1,277 @@
+'''
+Batch computation of the Macrel peptide features
+
+The per-sequence functions in `features.py` are reproduced here over many
+peptides at once. Sequences are encoded into a padded integer matrix a
+single time, and composition, charge, isoelectric point, aliphatic index,
+instability, Boman index, hydrophobicity, hydrophobic moment and CTDD are
+then obtained with NumPy array operations over that matrix.
+
+Floating point operations are performed in the same order as in the
+per-sequence path (including the order in which `sum()` visits the
+residues of `Counter(seq)`), so the output is bit-identical to
+`features.compute_all`. Hydrophobic moments for several angles can be
+obtained with `hmoments`.
+'''
+
+import sys
+import numpy as np
+from .features import rotation, window_sums
+from .database_features import eisenberg, instability2, _aa_groups
+from .database_features import pos_pks, neg_pks, boman_scale
+from .database_features import CTDD_groups
+
+
+# code 0 is padding, 1-26 are the letters A-Z and the last one is used for
+# any other character
+_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_NCODES = len(_LETTERS) + 2
+
+_code_table = np.full(256, _NCODES - 1, dtype=np.uint8)
+for _i, _aa in enumerate(_LETTERS):
+    _code_table[ord(_aa)] = _i + 1
+
+
+def _code(aa):
+    return _LETTERS.index(aa) + 1
+
+
+def _member_table(group):
+    table = np.zeros(_NCODES, dtype=bool)
+    for aa in group:
+        table[_code(aa)] = True
+    return table
+
+
+_group_tables = np.array([_member_table(g) for g in _aa_groups]).T
+_ctdd_tables = [_member_table(g) for g in CTDD_groups]
+
+_eisenberg_table = np.zeros(_NCODES)
+for _aa, _v in eisenberg.items():
+    _eisenberg_table[_code(_aa)] = _v
+
+_instability_table = np.zeros((_NCODES, _NCODES))
+for _dimer, _v in instability2.items():
+    _instability_table[_code(_dimer[0]), _code(_dimer[1])] = _v
+
+# The N- and C-terminus are always counted once
+_pos_ions = [(aa, 10**pk) for aa, pk in pos_pks.items()]
+_neg_ions = [(aa, 10**pk) for aa, pk in neg_pks.items()]
+
+
+def encode_seqs(seqs):
+    '''Encode sequences into a padded integer matrix
+
+    Parameters
+    ----------
+    seqs : list of str
+
+    Returns
+    -------
+    mat : ndarray of uint8, shape (len(seqs), max length)
+        Residue codes, padded with zeros
+    lens : ndarray of int64
+        Length of each sequence
+    '''
+    lens = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    mat = np.zeros((len(seqs), lens.max()), dtype=np.uint8)
+    mask = np.arange(lens.max()) < lens[:, None]
+    buf = np.frombuffer(''.join(seqs).encode('ascii'), dtype=np.uint8)
+    mat[mask] = _code_table[buf]
+    return mat, lens
+
+
+def count_residues(mat):
+    '''Count each residue code per row of an encoded matrix'''
+    n = mat.shape[0]
+    idx = mat + (np.arange(n, dtype=np.int64) * _NCODES)[:, None]
+    return np.bincount(idx.ravel(), minlength=n * _NCODES).reshape(n, _NCODES)
+
+
+def _first_occurrence(mat, code):
+    hit = (mat == code)
+    return np.where(hit.any(axis=1), hit.argmax(axis=1), mat.shape[1])
+
+
+def _builtin_sum(terms):
+    '''Sum the columns of `terms` from left to right as `sum()` would
+
+    Python 3.12 switched `sum()` over floats to compensated (Neumaier)
+    summation, which is replicated when running under it.
+    '''
+    total = np.zeros(terms.shape[0])
+    if sys.version_info < (3, 12):
+        for col in terms.T:
+            total += col
+        return total
+    comp = np.zeros(terms.shape[0])
+    for col in terms.T:
+        t = total + col
+        comp += np.where(np.abs(total) >= np.abs(col),
+                         (total - t) + col,
+                         (col - t) + total)
+        total = t
+    fix = (comp != 0.0) & np.isfinite(comp)
+    total[fix] += comp[fix]
+    return total
+
+
+def _scale_sum(mat, counts, scale):
+    '''Sum of `count * scale[aa]` over residues, in order of first occurrence
+
+    This is the order in which `Counter(seq)` stores its keys, which the
+    per-sequence implementation iterates over.
+    '''
+    letters = [aa for aa, v in scale.items() if v and aa in _LETTERS]
+    codes = [_code(aa) for aa in letters]
+    terms = counts[:, codes] * np.array([scale[aa] for aa in letters])
+    first = np.stack([_first_occurrence(mat, c) for c in codes], axis=1)
+    order = np.argsort(first, axis=1, kind='stable')
+    return _builtin_sum(np.take_along_axis(terms, order, axis=1))
+
+
+def _ion_counts(counts):
+    cols = []
+    for aa, _ in _pos_ions + _neg_ions:
+        if aa in ('Nterm', 'Cterm'):
+            cols.append(np.ones(counts.shape[0]))
+        else:
+            cols.append(counts[:, _code(aa)].astype(np.float64))
+    return np.stack(cols, axis=1)
+
+
+def _pow10(ph):
+    # Python's `10**ph` is used on the (few) distinct values so that the
+    # result does not depend on the vectorized `np.power` implementation
+    uniq, inv = np.unique(ph, return_inverse=True)
+    return np.array([10**x for x in uniq.tolist()])[inv.ravel()]
+
+
+def _charge(ions, ph10):
+    net = np.zeros(len(ph10))
+    npos = len(_pos_ions)
+    for j, (_, pK10) in enumerate(_pos_ions):
+        c_r = pK10 / ph10
+        net += ions[:, j] * (c_r / (c_r + 1.0))
+    for j, (_, pK10) in enumerate(_neg_ions):
+        c_r = ph10 / pK10
+        net -= ions[:, npos + j] * (c_r / (c_r + 1.0))
+    return net
+
+
+def _isoelectric_point(ions, charge):
+    ph = np.full(len(charge), 7.0)
+    charge = charge.copy()
+    up = charge > 0.0
+
+    def step(active, delta, keep_going):
+        while active.any():
+            idx = np.flatnonzero(active)
+            ph[idx] += delta
+            charge[idx] = _charge(ions[idx], _pow10(ph[idx]))
+            active[idx] = keep_going(charge[idx])
+
+    step(up.copy(), 1.0, lambda c: c > 0.0)
+    step(~up & (charge < 0.0), -1.0, lambda c: c < 0.0)
+
+    ph1 = np.where(up, ph - 1.0, ph)
+    ph2 = np.where(up, ph, ph + 1.0)
+    active = (ph2 - ph1 > 0.0001) & (charge != 0.0)
+    while active.any():
+        idx = np.flatnonzero(active)
+        mid = (ph1[idx] + ph2[idx]) / 2.0
+        ph[idx] = mid
+        c = _charge(ions[idx], _pow10(mid))
+        charge[idx] = c
+        pos = c > 0.0
+        ph1[idx[pos]] = mid[pos]
+        ph2[idx[~pos]] = mid[~pos]
+        active[idx] = (ph2[idx] - ph1[idx] > 0.0001) & (c != 0.0)
+    return ph
+
+
+def _instability_index(mat, lens):
+    stabindex = np.zeros(mat.shape[0])
+    for i in range(mat.shape[1] - 1):
+        stabindex += _instability_table[mat[:, i], mat[:, i + 1]]
+    return (10.0 / lens) * stabindex
+
+
+def _ctdd(mat, lens):
+    code = []
+    for table in _ctdd_tables:
+        member = table[mat]
+        first = member.argmax(axis=1)
+        code.append(np.where(member.any(axis=1),
+                             (first + 1) / lens * 100,
+                             0.0))
+    return code
+
+
+def _hmoment(mat, lens, angle, window):
+    h = _eisenberg_table[mat]
+    cos, sin = rotation(angle, mat.shape[1])
+    hcos = h * cos
+    hsin = h * sin
+    wdws = np.minimum(window, lens)
+    moment = np.empty(len(lens))
+    # sequences shorter than the window use their full length, so rows are
+    # processed in groups sharing the same window size
+    for wdw in np.unique(wdws):
+        rows = np.flatnonzero(wdws == wdw)
+        vcos = window_sums(hcos[rows], wdw)
+        vsin = window_sums(hsin[rows], wdw)
+        vcos **= 2.
+        vsin **= 2.
+        moms = vsin
+        moms += vcos
+        # windows running into the padding are not valid
+        moms[np.arange(moms.shape[1]) > (lens[rows] - wdw)[:, None]] = -np.inf
+        moment[rows] = np.sqrt(moms.max(axis=1)) / wdw
+    return moment
+
+
+def hmoments(seqs, angles=(100, 160), window=11):
+    '''Hydrophobic moments of many sequences for several angles at once
+
+    The default angles are those of the alpha-helix (100) and the
+    beta-sheet (160). Returns an array of shape (len(seqs), len(angles))
+    whose values are equal to `hmoment(seq, angle, window)`.
+    '''
+    mat, lens = encode_seqs(seqs)
+    return np.column_stack([_hmoment(mat, lens, angle, window)
+                            for angle in angles])
+
+
+def compute_batch(seqs):
+    '''Compute Macrel features for a list of (normalized) sequences
+
+    Returns an array of shape (len(seqs), 22), whose rows are equal to
+    `compute_all(seq)` for each sequence.
+    '''
+    mat, lens = encode_seqs(seqs)
+    counts = count_residues(mat)
+    fcounts = counts.astype(np.float64)
+
+    composition = (counts @ _group_tables) / lens[:, None]
+
+    ions = _ion_counts(counts)
+    charge = _charge(ions, _pow10(np.full(len(seqs), 7.0)))
+    pI = _isoelectric_point(ions, charge)
+
+    aindex = 100.0 * (
+            fcounts[:, _code('A')] +
+            2.9 * fcounts[:, _code('V')] +
+            3.9 * (fcounts[:, _code('I')] + fcounts[:, _code('L')])
+            ) / lens
+
+    return np.column_stack(
+            [composition,
+             charge,
+             pI,
+             aindex,
+             _instability_index(mat, lens),
+             _scale_sum(mat, counts, boman_scale) / lens,
+             _scale_sum(mat, counts, eisenberg) / lens,
+             _hmoment(mat, lens, angle=100, window=11)] +
+            _ctdd(mat, lens))
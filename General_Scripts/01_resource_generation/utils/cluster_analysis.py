@@ -6,20 +6,15 @@ def analyze_level_III(analysis_folder):
     the families which will be selected by
     size to next computations.
     '''
-    import gzip
     import pandas as pd
     from collections import Counter
-    from Bio import SeqIO
+    from seqstore import load_index, iter_records
 
     # loading info about peptides and families
     infile = f'{analysis_folder}/AMPSphere_v.2022-03.faa.gz'
     lv3 = dict()
-    for record in SeqIO.parse(gzip.open(infile,
-                                        'rt',
-                                        encoding='utf-8'),
-                              'fasta'):
-        lv3[record.id] = [str(record.seq),
-                          record.description.split(' | ')[1]]
+    for access, family, seq in iter_records(load_index(infile)):
+        lv3[access] = [seq, family]
 
     # selecting families of at least 8 peptides
     select_fam = [v[1] for k, v in lv3.items()]
@@ -80,17 +75,14 @@ def alignments(select_fam, analysis_folder):
     '''
     import subprocess
     for f in select_fam:
-        f = 'SPHERE-III.000_002'
         ifile = f'{analysis_folder}/families/fastas/{f}.faa'
         ofile = f'{analysis_folder}/families/aln/{f}.aln'
 
-        subprocess.check_call(
-                ' '.join(['muscle',
-                        '-align', ifile,
-                        '-output', ofile,
-                        '-maxiters', '1',
-                        '-diags',
-                        ])
+        subprocess.check_call(['muscle',
+                               '-align', ifile,
+                               '-output', ofile,
+                               '-maxiters', '1',
+                               '-diags'])
 
 def trees(select_fam, analysis_folder):
     '''
@@ -196,13 +196,14 @@ def hmoment(seq, angle = 100, window = 11):
     # 0.2705906
     '''
     wdw = min(window, len(seq))  # if sequence is shorter than window, take the whole sequence instead
-    mtrx = np.array([eisenberg[aa] for aa in seq], dtype=np.float64)  #[::-1]
-    mwdw = np.array([mtrx[i:i + wdw] for i in range(len(mtrx) - wdw + 1)])
-    rads = angle * (np.pi / 180) * np.arange(wdw)  # calculate actual moment (radial)
-
-    vcos = np.dot(mwdw, np.cos(rads))
-    vsin = np.dot(mwdw, np.sin(rads))
-    # The code below is optimized to avoid copies
+    mtrx = np.array([eisenberg[aa] for aa in seq], dtype=np.float64)
+    cos, sin = rotation(angle, len(seq))
+    # The moment of a window does not change if all angles are rotated by
+    # the same amount, so the window sums of h_j*cos(j*angle) and
+    # h_j*sin(j*angle) are obtained from cumulative sums instead of
+    # building one vector per window
+    vcos = window_sums(mtrx * cos, wdw)
+    vsin = window_sums(mtrx * sin, wdw)
     vcos **= 2.
     vsin **= 2.
     moms = vsin
@@ -210,6 +211,34 @@ def hmoment(seq, angle = 100, window = 11):
     return math.sqrt(moms.max()) / wdw
 
 
+_rotations = {}
+
+
+def rotation(angle, n):
+    '''
+    Returns cos and sin of `j * angle` (in degrees) for j in range(n).
+
+    Values are computed once per angle (with `math`, so they do not depend
+    on the shape of the array) and reused afterwards.
+    '''
+    cached = _rotations.get(angle)
+    if cached is None or len(cached[0]) < n:
+        rads = [angle * (math.pi / 180) * j for j in range(max(n, 256))]
+        cached = (np.array([math.cos(r) for r in rads]),
+                  np.array([math.sin(r) for r in rads]))
+        _rotations[angle] = cached
+    return cached[0][:n], cached[1][:n]
+
+
+def window_sums(values, wdw):
+    '''
+    Sums of all windows of size `wdw` along the last axis of `values`
+    '''
+    csum = np.cumsum(values, axis=-1)
+    csum = np.concatenate([np.zeros(csum.shape[:-1] + (1,)), csum], axis=-1)
+    return csum[..., wdw:] - csum[..., :-wdw]
+
+
 def compute_all(seq):
     aa_content = dict(Counter(seq))
     aa_content['Nterm'] = 1
@@ -226,11 +255,90 @@ def compute_all(seq):
              ctdd(seq, CTDD_groups))
 
 
-def calc_features():
+FEATURE_NAMES = [
+        "tinyAA",
+        "smallAA",
+        "aliphaticAA",
+        "aromaticAA",
+        "nonpolarAA",
+        "polarAA",
+        "chargedAA",
+        "basicAA",
+        "acidicAA",
+        "charge",
+        "pI",
+        "aindex",
+        "instaindex",
+        "boman",
+        "hydrophobicity",
+        "hmoment",
+        "SA.Group1.residue0",
+        "SA.Group2.residue0",
+        "SA.Group3.residue0",
+        "HB.Group1.residue0",
+        "HB.Group2.residue0",
+        "HB.Group3.residue0",
+        ]
+
+
+def _blocks(iterable, size):
+    from itertools import islice
+    it = iter(iterable)
+    while True:
+        block = list(islice(it, size))
+        if not block:
+            return
+        yield block
+
+
+def _features_table(task):
     '''
-    Calculating Macrel features per sequence in AMPsphere
+    Compute the features of one block of (header, sequence) pairs and
+    return them already formatted as TSV text
     '''
     import pandas as pd
+    from .batch_features import compute_batch
+
+    index, block = task
+    headers = [h for h, _ in block]
+    seqs = [normalize_seq(seq) for _, seq in block]
+    features = pd.DataFrame(compute_batch(seqs),
+                            index=headers,
+                            columns=FEATURE_NAMES)
+    return features.to_csv(sep='\t',
+                           index_label='accession',
+                           header=(index == 0))
+
+
+def _ordered_map(fn, tasks, workers):
+    '''
+    Map `fn` over `tasks` with a pool of processes, yielding results in
+    input order. Only `2 * workers` tasks are in flight at any moment, so
+    the input is consumed as a stream.
+    '''
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(fn, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def calc_features(workers=1, chunksize=20_000):
+    '''
+    Calculating Macrel features per sequence in AMPsphere
+
+    Sequences are streamed from the FASTA file in blocks of `chunksize`
+    and each block is written to the output as soon as it is ready. With
+    `workers > 1`, blocks are computed in a pool of processes; output
+    order and values are the same as in the serial run.
+    '''
+    import gzip
     
     data_folder = 'data/'
     analysis_folder = 'analysis/'
@@ -239,37 +347,12 @@ def calc_features():
     ofile = f'{analysis_folder}/AMPSphere_v.2022-03.features.tsv.gz'
     
     print('Calculating peptide features used by Macrel...')
-    seqs, headers, features = [], [], []
-    for h, seq in fasta_iter(ifile):
-        seq = normalize_seq(seq)
-        seqs.append(seq)
-        headers.append(h)
-        features.append(compute_all(seq))
-
-    features = pd.DataFrame(features, index=headers, columns=[
-            "tinyAA",
-            "smallAA",
-            "aliphaticAA",
-            "aromaticAA",
-            "nonpolarAA",
-            "polarAA",
-            "chargedAA",
-            "basicAA",
-            "acidicAA",
-            "charge",
-            "pI",
-            "aindex",
-            "instaindex",
-            "boman",
-            "hydrophobicity",
-            "hmoment",
-            "SA.Group1.residue0",
-            "SA.Group2.residue0",
-            "SA.Group3.residue0",
-            "HB.Group1.residue0",
-            "HB.Group2.residue0",
-            "HB.Group3.residue0",
-            ])
-
-    features.to_csv(ofile, sep='\t', index_label='accession')
-    
+    tasks = enumerate(_blocks(fasta_iter(ifile), chunksize))
+    if workers > 1:
+        tables = _ordered_map(_features_table, tasks, workers)
+    else:
+        tables = map(_features_table, tasks)
+
+    with gzip.open(ofile, 'wt') as out:
+        for table in tables:
+            out.write(table)
@@ -11,22 +11,17 @@ def protein_check(seq):
 
 
 def features_for_web():
-    import gzip
     import pandas as pd
-    from Bio import SeqIO
+    from seqstore import load_index, iter_records
 
     fams = pd.read_table('analysis/SPHERE_v.2022-03.levels_assessment.tsv.gz')
     fams = fams[['AMP accession', 'SPHERE_fam level III']]
     fams.columns = ['id', 'family']
 
-    seqs = []
-    for record in SeqIO.parse(gzip.open('analysis/AMPSphere_v.2022-03.faa.gz',
-                                        'rt'),
-                              'fasta'):
-        seqs.append((record.id, record.seq))
+    index = load_index('analysis/AMPSphere_v.2022-03.faa.gz')
+    seqs = [(access, seq) for access, _, seq in iter_records(index)]
 
     seqs = pd.DataFrame(seqs, columns=['id', 'sequence'])
-    seqs.sequence = [''.join(x) for x in seqs.sequence]
     seqs['length'] = seqs.sequence.apply(lambda x: len(x))
 
     prot_feat = [protein_check(x) for x in seqs.sequence]
@@ -5,7 +5,7 @@ def genes():
     '''
     import lzma
     import pandas as pd
-    from Bio import SeqIO
+    from seqstore import parse_fasta
     
     data_folder = 'data/'
     analysis_folder = 'analysis/'
@@ -25,15 +25,12 @@ def genes():
     # generating output
     fout = f'{analysis_folder}/AMPSphere_v.2022-03.fna.xz'
     
+    # genes are streamed a single time, so no index is built here
     fin = f'{data_folder}/gmsc_genes.fna.xz'
-    fin = lzma.open(fin, 'rt', encoding='utf-8')
     
     with lzma.open(fout, 'wt', encoding='utf-8') as dbout:
-        for record in SeqIO.parse(fin,
-                                  'fasta'):
-            header = f'>{record.id} | {dictresource[record.id]}\n'
+        for gene, _, seq in parse_fasta(fin):
+            header = f'>{gene} | {dictresource[gene]}\n'
             print(header.strip())
-            dbout.write(f'{header}{str(record.seq)}\n')
-
-    fin.close()
+            dbout.write(f'{header}{seq}\n')
     
@@ -1,4 +1,22 @@
-def eliminate_non_standard_aas(infile):
+# residues not accepted in AMPSphere
+_NON_STANDARD = frozenset('bBoOxXuUzZjJ')
+
+
+def _standard_amps(infile):
+    '''
+    Yields (gene, sequence) from the macrel predictions table
+    for AMPs without non-standard residues
+    '''
+    import gzip
+
+    with gzip.open(infile, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('\t')
+            if len(line) == 6 and _NON_STANDARD.isdisjoint(line[1]):
+                yield line[0], line[1]
+
+
+def eliminate_non_standard_aas(infile, genes_file=None):
     '''
     Eliminate rows with non-standard residues and
     check for the consistency of the original
@@ -7,34 +25,34 @@ def eliminate_non_standard_aas(infile):
     Input: 
     infile - address of file containing the output from macrel
              prediction for metagenomes
+    genes_file - if given, the sequence and gene of every AMP kept
+                 are written to this file (used by `link_gmsc`), so
+                 the input does not need to be read again
     
     Output:
-    ofile - address of file to be saved containing filtered results
+    counts - Counter of the number of times each AMP was seen,
+             built while streaming the input
     '''
-    import gzip
-    import re
+    from collections import Counter
     
-    amps_seen = []
-    with gzip.open(infile, 'rt', encoding='utf-8') as f:
-        for line in f:
-            line = line.split('\t')
-            if len(line) == 6: 
-                matches = re.findall('b|B|o|O|x|X|u|U|z|Z|j|J', line[1])
-                if matches: continue
-                else: amps_seen.append(line[1])
+    counts = Counter()
+    if genes_file is None:
+        counts.update(seq for _, seq in _standard_amps(infile))
+    else:
+        with open(genes_file, 'w') as genes:
+            for gene, seq in _standard_amps(infile):
+                counts[seq] += 1
+                genes.write(f'{seq}\t{gene}\n')
 
-    print(f'It was found a total of {len(amps_seen)} AMPs')
+    print(f'It was found a total of {sum(counts.values())} AMPs')
     
-    return amps_seen
+    return counts
     
 
-def out_singletons(amps_seen):
+def out_singletons(counts):
     '''
     Eliminating AMPs do not appearing more than once
     '''
-    from collections import Counter
-
-    counts = Counter(amps_seen)
     singletons, non_singletons = set(), dict()
     for k, v in counts.items():
         if v == 1: singletons.add(k) 
@@ -45,7 +63,60 @@ def out_singletons(amps_seen):
 
     return (singletons, non_singletons)        
     
-    
+
+def partitioned_singletons(infile, partitions, genes_dir):
+    '''
+    Same as `out_singletons(eliminate_non_standard_aas(infile))`, but
+    the filtered sequences are first spilled to disk into `partitions`
+    files by sequence hash, and each partition is counted on its own.
+    Memory is then bounded by the unique sequences of one partition.
+
+    Non-singletons are returned in order of first appearance, as in
+    the in-memory path.
+
+    The partition files (sequence, gene and row) are kept in `genes_dir`
+    and their names returned, to be used by `link_gmsc`.
+    '''
+    import os
+    import zlib
+    from collections import Counter
+
+    os.makedirs(genes_dir, exist_ok=True)
+    genes_files = [f'{genes_dir}/part_{i}.tsv' for i in range(partitions)]
+
+    total = 0
+    singletons, non_singletons = set(), []
+    parts = [open(f, 'w') for f in genes_files]
+    for idx, (gene, seq) in enumerate(_standard_amps(infile)):
+        part = zlib.crc32(seq.encode('ascii')) % partitions
+        parts[part].write(f'{seq}\t{gene}\t{idx}\n')
+        total += 1
+    for p in parts:
+        p.close()
+
+    for f in genes_files:
+        counts = Counter()
+        first = dict()
+        with open(f) as p:
+            for line in p:
+                seq, _, idx = line.split()
+                if seq not in first:
+                    first[seq] = int(idx)
+                counts[seq] += 1
+        for k, v in counts.items():
+            if v == 1: singletons.add(k)
+            else: non_singletons.append((first[k], k, v))
+
+    non_singletons.sort()
+    non_singletons = {k: v for _, k, v in non_singletons}
+
+    print(f'It was found a total of {total} AMPs')
+    print(f'Singletons: {len(singletons)}')
+    print(f'Non-Singletons: {len(non_singletons)}')
+
+    return (singletons, non_singletons, genes_files)
+
+
 def precomputed_res(data_folder, outdir):
     '''
     Uploads and returns the singleton candidates
@@ -123,44 +194,34 @@ def recovering_singletons(singletons, outdir, dramp):
         return singletons_saved
 
     
-def reduceseq(seq):
+def reduceseq(seq, alphabet='8'):
     '''
     # Clustering after reducing alphabet
     to 8 letters:
     [LVMIC], [AG], [ST], P,
     [FWY], [EDQN], [KR], H
+    (other alphabets in `alphabets.ALPHABETS`)
     # Refs:
     # doi: 10.1093/protein/13.3.149
     # doi: 10.1093/bioinformatics/btp164
     # Solis, AD. Proteins 2015; 83:2198–2216.
     '''
-    aas = {'V': 'L', 'M': 'L',
-           'I': 'L', 'C': 'L',
-           'G': 'A', 'T': 'S',
-           'W': 'F', 'Y': 'F',
-           'D': 'E', 'Q': 'E',
-           'N': 'E', 'R': 'K'}
-
-    nseq = ''
-    for i in seq.strip():
-        nseq += aas.get(i, i)
-        
-    return nseq
+    from alphabets import reduce_seq
+    return reduce_seq(seq, alphabet)
 
 
-def clusteramps(non_singletons, outdir):
+def clusteramps(non_singletons, outdir, alphabet='8'):
     '''
     Recover singletons with homologs in DRAMP,
     a database of AMPs
     '''
     import os
     from .utils import call_cdhit, call_crev
+    from alphabets import write_reduced_fasta
 
     Nthreads = 3
     
-    with open(f'{outdir}/temp.fa', 'w') as infile:
-        for k in non_singletons.keys():
-            infile.write(f'>{k}\n{reduceseq(k)}\n')
+    write_reduced_fasta(non_singletons.keys(), f'{outdir}/temp.fa', alphabet)
 
     print('Hierarchical clustering started')
 
@@ -223,14 +284,15 @@ def AMPSPHERE_code(idx):
     return f'AMP10.{ac}'
 
     
-def link_gmsc(infile2, datafile, outfile):
+def link_gmsc(infile2, genes_files, outfile):
     '''
     Function to generate the correspondence list between the
     headers from AMPsphere and from GMSC
+
+    genes_files - tables of sequence and gene (first two columns)
+                  written while counting the macrel predictions
     '''
-    import gzip
     import pandas as pd
-    from collections import defaultdict
         
     # get descending sorted amps list
     amp_list = pd.DataFrame.from_dict(infile2, orient='index', columns=['size'])
@@ -251,19 +313,22 @@ def link_gmsc(infile2, datafile, outfile):
     # defining references
     print('\t\tOpening initial files, it can take a while...')
     seqs = set(amp_list['sequence'])                
-    dictresource = defaultdict(list)
-    with gzip.open(datafile, 'rt', encoding='utf-8') as enc:
-        for x in enc:
-            tokens = x.split('\t')
-            if tokens[1] in seqs:
-                dictresource[tokens[1]].append(tokens[0])
-    
-    dictresource = [(k, ','.join(v), len(v)) for k,v in dictresource.items()]
+    genes = []
+    for f in genes_files:
+        for chunk in pd.read_table(f,
+                                   header=None,
+                                   usecols=[0, 1],
+                                   names=['sequence', 'gene'],
+                                   dtype=str,
+                                   keep_default_na=False,
+                                   chunksize=10_000_000):
+            genes.append(chunk[chunk['sequence'].isin(seqs)])
+    genes = pd.concat(genes)
     
-    genes = pd.DataFrame(dictresource,
-                         columns=['sequence',
-                                  'genes',
-                                  'n_of_genes'])
+    # genes keep the order in which they appear in the macrel table
+    genes = genes.groupby('sequence', sort=False)['gene']
+    genes = genes.agg(genes=','.join, n_of_genes='size')
+    genes = genes.reset_index()
       
     df = amp_list.merge(on='sequence', right=genes)
 
@@ -460,12 +525,19 @@ def fasta_file(analysis_folder):
                 ofile.write(f'>{header} | {f}\n{seq}\n')
    
                
-def run_pipe():
+def run_pipe(partitions=1, alphabet='8'):
     '''
     Run the entire pipeline until the clustering
     and organization of families
+
+    With `partitions > 1`, the GMSC predictions are counted by spilling
+    them to that many temporary files, which bounds memory usage
+
+    Sequences are clustered in the reduced `alphabet` (see
+    `alphabets.ALPHABETS`)
     '''
     import os
+    import shutil
     from .timeout_input import timeout_input
     
     print('Set up environment')
@@ -478,10 +550,23 @@ def run_pipe():
         os.makedirs(d, exist_ok=True)
 
     print('Eliminating sequences containing non-standard residues')
-    amps_seen = eliminate_non_standard_aas(f'{data_folder}/GMSC10.Macrel_05.AMPs.tsv.gz')
+    # genes of each AMP are recorded in this same pass over the
+    # predictions, to be linked to AMPSphere accessions later
+    infile = f'{data_folder}/GMSC10.Macrel_05.AMPs.tsv.gz'
+    genes_dir = f'{analysis_folder}/amp_genes'
+    if partitions > 1:
+        print('-- Filtering singletons in partitions:')
+        singletons, non_singletons, genes_files = partitioned_singletons(infile,
+                                                                         partitions,
+                                                                         genes_dir)
+    else:
+        os.makedirs(genes_dir, exist_ok=True)
+        genes_files = [f'{genes_dir}/amp_genes.tsv']
+        counts = eliminate_non_standard_aas(infile, genes_files[0])
     
-    print('-- Filtering singletons:')
-    singletons, non_singletons = out_singletons(amps_seen)
+        print('-- Filtering singletons:')
+        singletons, non_singletons = out_singletons(counts)
+        del counts
     
     print('Recovering AMPs matching to DRAMP but still singletons')
     
@@ -503,12 +588,13 @@ def run_pipe():
     for s in singletons_saved: non_singletons[s] = 1
      
     print('Clustering AMPs')
-    clusteramps(non_singletons, analysis_folder)
+    clusteramps(non_singletons, analysis_folder, alphabet)
     
     print('Link AMPs to GMSC genes')
     link_gmsc(non_singletons,
-              f'{data_folder}/GMSC10.Macrel_05.AMPs.tsv.gz',
+              genes_files,
               f'{analysis_folder}/AMPsphere_GMSC_correspondence.tsv.gz')
+    shutil.rmtree(genes_dir)
 
     print('Analyzing families')
     spheres(analysis_folder)
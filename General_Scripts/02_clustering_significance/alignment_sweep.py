@@ -0,0 +1,116 @@
+'''
+Global alignment scores of peptide pairs for several gap penalties
+
+Scores are cached on disk, one directory per substitution matrix and gap
+setting:
+
+    outputs/alignment_cache/BLOSUM62/-10_-0.5/<shard>.tsv
+
+Each shard lists (query, target, score) and is written atomically, so
+several jug processes can fill the cache at the same time. `sweep` only
+aligns the pairs missing from the cache. Each missing pair is visited
+once: its sequences are fetched and it is scored for every gap setting
+before moving on to the next pair.
+
+As in `pairwise2.align.globalds`/`globaldx`, a setting with no negative
+gap score is aligned without gap penalties.
+'''
+
+import os
+import numpy as np
+
+CACHE_DIR = 'outputs/alignment_cache'
+
+_matrices = {}
+_aligners = {}
+
+
+def _aligner(matrix, gap_open, gap_extend):
+    from Bio.Align import PairwiseAligner
+    import Bio.Align.substitution_matrices as mt
+    key = (matrix, gap_open, gap_extend)
+    if key not in _aligners:
+        if matrix not in _matrices:
+            _matrices[matrix] = mt.load(matrix)
+        aligner = PairwiseAligner()
+        aligner.mode = 'global'
+        aligner.substitution_matrix = _matrices[matrix]
+        if gap_open < 0 or gap_extend < 0:
+            aligner.open_gap_score = gap_open
+            aligner.extend_gap_score = gap_extend
+        else:
+            aligner.gap_score = 0
+        _aligners[key] = aligner
+    return _aligners[key]
+
+
+def _cache_dir(matrix, gap_open, gap_extend, cache_dir):
+    return f'{cache_dir}/{matrix}/{gap_open}_{gap_extend}'
+
+
+def load_cache(matrix, gap_open, gap_extend, cache_dir=CACHE_DIR):
+    '''
+    Scores already computed for a setting, as a dictionary of
+    (query, target) to score
+    '''
+    scores = dict()
+    folder = _cache_dir(matrix, gap_open, gap_extend, cache_dir)
+    if not os.path.isdir(folder):
+        return scores
+    for fname in sorted(os.listdir(folder)):
+        if not fname.endswith('.tsv'):
+            continue
+        with open(f'{folder}/{fname}') as f:
+            for line in f:
+                query, target, score = line.rstrip('\n').split('\t')
+                scores[query, target] = float(score)
+    return scores
+
+
+def _write_shard(rows, matrix, gap_open, gap_extend, cache_dir):
+    import hashlib
+    folder = _cache_dir(matrix, gap_open, gap_extend, cache_dir)
+    os.makedirs(folder, exist_ok=True)
+    content = ''.join(f'{q}\t{t}\t{score!r}\n' for q, t, score in rows)
+    name = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    tmp = f'{folder}/.{name}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as out:
+        out.write(content)
+    os.replace(tmp, f'{folder}/{name}.tsv')
+
+
+def sweep(pairs, sequences, settings, matrix='BLOSUM62', cache_dir=CACHE_DIR):
+    '''
+    Alignment scores of `pairs` for each gap setting
+
+    Parameters
+    ----------
+    pairs : list of (query, target)
+        Accessions of the sequences to align
+    sequences : dict-like
+        Accession to sequence
+    settings : list of (gap_open, gap_extend)
+
+    Returns
+    -------
+    scores : dict
+        (gap_open, gap_extend) -> array with the score of each pair
+    '''
+    settings = list(settings)
+    caches = {s: load_cache(matrix, *s, cache_dir) for s in settings}
+    todo = sorted({p for p in pairs for s in settings if p not in caches[s]})
+
+    new = {s: [] for s in settings}
+    for query, target in todo:
+        seq1, seq2 = sequences[query], sequences[target]
+        for s in settings:
+            if (query, target) not in caches[s]:
+                score = _aligner(matrix, *s).score(seq1, seq2)
+                caches[s][query, target] = score
+                new[s].append((query, target, score))
+
+    for s, rows in new.items():
+        if rows:
+            _write_shard(rows, matrix, *s, cache_dir)
+
+    return {s: np.array([caches[s][p] for p in pairs]) for s in settings}
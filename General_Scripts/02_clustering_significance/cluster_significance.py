@@ -3,14 +3,8 @@ def seqload():
     Load AMPSphere peptide sequences
     as a dictionary
     '''
-    import gzip
-    from Bio import SeqIO
-    f = gzip.open('data/AMPSphere_v.2022-03.faa.gz',
-                  'rt', encoding='utf-8')
-    seqdict = dict()
-    for record in SeqIO.parse(f, 'fasta'):
-        seqdict[record.id] = str(record.seq)
-    return seqdict
+    from seqstore import seqdict
+    return seqdict('data/AMPSphere_v.2022-03.faa.gz')
 
 
 def clusters_load():
@@ -64,6 +58,7 @@ def sample_seqs(data, representatives: list, level: str, n=1000):
     Inputs: data - dataframe obtained from clusters_load()
             representatives - list of AMP accessions of representatives
             level - string representing the clustering level (I, II, III)
+            n - number of samples, or None to take all cluster members
     '''
     from collections import Counter
     # filter representatives off
@@ -73,6 +68,8 @@ def sample_seqs(data, representatives: list, level: str, n=1000):
     tobesampled = tobesampled[tobesampled[f'SPHERE_fam level {level}'].isin(kexcl)]
     tobesampled = tobesampled[['AMP accession', f'SPHERE_fam level {level}']]
     # perform sampling
+    if n is None:
+        return tobesampled['AMP accession'].tolist()
     return tobesampled.sample(n)['AMP accession'].tolist()
 
 
@@ -102,42 +99,122 @@ def fix_rnsamples(data, sample, representatives, level):
     return sample
 
 
+# substitution matrix and aligners are created once per process
+_blosum62 = None
+_aligners = {}
+
+# bonus added to identical residues to break ties between co-optimal
+# alignments (see aln); it must keep every bonus total (at most
+# TIEBREAK * length of the shortest sequence) below the smallest score
+# difference, 0.5 with BLOSUM62 and half-integer gap scores, which holds
+# for sequences shorter than 5000 residues
+TIEBREAK = 1e-4
+
+
+def _aligner(gap_open=-10, gap_extend=-0.5, tiebreak=False):
+    '''
+    Global aligner with BLOSUM62 and the given gap scores, equivalent
+    to `pairwise2.align.globalds`
+
+    With `tiebreak`, identical residues score TIEBREAK more than in
+    BLOSUM62
+    '''
+    global _blosum62
+    from Bio.Align import PairwiseAligner
+    import Bio.Align.substitution_matrices as mt
+    key = (gap_open, gap_extend, tiebreak)
+    if key not in _aligners:
+        if _blosum62 is None:
+            _blosum62 = mt.load('BLOSUM62')
+        matrix = _blosum62
+        if tiebreak:
+            matrix = _blosum62.copy()
+            for c in matrix.alphabet:
+                matrix[c, c] += TIEBREAK
+        aligner = PairwiseAligner()
+        aligner.mode = 'global'
+        aligner.substitution_matrix = matrix
+        aligner.open_gap_score = gap_open
+        aligner.extend_gap_score = gap_extend
+        _aligners[key] = aligner
+    return _aligners[key]
+
+
 def _calculate_identity(sequenceA, sequenceB):
     """
     Returns the percentage of identical characters between two sequences.
     Assumes the sequences are aligned.
     """
-    sa, sb, sl = sequenceA, sequenceB, len(sequenceA)
-    matches = [sa[i] == sb[i] for i in range(sl)]
-    length = len([1 for i in range(sl) if sa[i] != '-'])
-    seq_id = (100 * sum(matches)) / sl
-    gapless_sl = sum([1 for i in range(sl) if (sa[i] != '-' and sb[i] != '-')])
-    gap_id = (100 * sum(matches)) / gapless_sl
+    sl = len(sequenceA)
+    matches, length, gapless_sl = 0, 0, 0
+    for a, b in zip(sequenceA, sequenceB):
+        matches += (a == b)
+        if a != '-':
+            length += 1
+            if b != '-':
+                gapless_sl += 1
+    seq_id = (100 * matches) / sl
+    gap_id = (100 * matches) / gapless_sl
     cov = (100 * gapless_sl) / length
     return (seq_id, gap_id, cov)
 
 
+def _alignment_identity(alignment, seq1, seq2):
+    '''
+    Same as `_calculate_identity`, but from the path of a
+    `PairwiseAligner` alignment, without building the gapped strings
+    '''
+    # `path` (Biopython < 1.80, e.g. 1.76 in environment.yml) was
+    # replaced by `coordinates`, which holds the same points transposed
+    if hasattr(alignment, 'coordinates'):
+        path = alignment.coordinates.T.tolist()
+    else:
+        path = alignment.path
+    sl, matches, gapless_sl = 0, 0, 0
+    for (i, j), (ni, nj) in zip(path, path[1:]):
+        di, dj = ni - i, nj - j
+        sl += max(di, dj)
+        if di and dj:
+            gapless_sl += di
+            matches += sum(a == b for a, b in zip(seq1[i:i+di], seq2[j:j+dj]))
+    seq_id = (100 * matches) / sl
+    gap_id = (100 * matches) / gapless_sl
+    cov = (100 * gapless_sl) / len(seq1)
+    return (seq_id, gap_id, cov, sl)
+
+
 def aln(seq1,
         seq2,
         gap_open=-10,
         gap_extend=-0.5):
     '''
     Align two sequences using BLOSUM62
-    Returns score and alignment length
+    Returns identity, gapless identity, coverage,
+    score and alignment length
+
+    Among the co-optimal alignments (same BLOSUM62 score), the one with
+    most identical residues is used, so identities do not depend on
+    the traceback order of the aligner (pairwise2 and PairwiseAligner
+    pick different alignments in ties). Remaining ties are broken by
+    PairwiseAligner, which returns its first alignment
     '''
-    from Bio.pairwise2 import align
-    import Bio.Align.substitution_matrices as mt
-    alignments = align.globalds(seq1,
-                                seq2,
-                                mt.load('BLOSUM62'),
-                                gap_open,
-                                gap_extend)
-    aligned_A, aligned_B, score, begin, end = alignments[0]
-    lent = end - begin  # alignment length
-    seq_id, g_seq_id, cov = _calculate_identity(aligned_A, aligned_B)
+    alignment = _aligner(gap_open, gap_extend, tiebreak=True).align(seq1, seq2)[0]
+    score = _aligner(gap_open, gap_extend).score(seq1, seq2)
+    seq_id, g_seq_id, cov, lent = _alignment_identity(alignment, seq1, seq2)
     return (seq_id, g_seq_id, cov, score, lent)
 
 
+def aln_score(seq1,
+              seq2,
+              gap_open=-10,
+              gap_extend=-0.5):
+    '''
+    Score of the alignment of two sequences using BLOSUM62, without
+    computing the alignment itself (enough for e-values)
+    '''
+    return _aligner(gap_open, gap_extend).score(seq1, seq2)
+
+
 def f_evalue(seq1, score, use_gapped=True):
     '''
     From a sequence length and a score of the
@@ -165,41 +242,70 @@ def f_evalue(seq1, score, use_gapped=True):
     return N * np.exp(-Sbit)
 
 
-def align_to_representative(sample_df):
+def _align_pairs(args):
+    '''
+    Align a list of (query sequence, target sequence) pairs
+
+    Returns a list of (identity, gap_identity, coverage, score, aln_len,
+    evalue); only score and evalue are computed if `score_only`
+    '''
+    pairs, gap_open, gap_extend, score_only = args
+    out = []
+    for query, target in pairs:
+        if score_only:
+            score = aln_score(query, target, gap_open, gap_extend)
+            res = (None, None, None, score, None)
+        else:
+            res = aln(query, target, gap_open, gap_extend)
+        out.append(res + (f_evalue(query, res[3]),))
+    return out
+
+
+def align_to_representative(sample_df,
+                            workers=1,
+                            score_only=False,
+                            gap_open=-10,
+                            gap_extend=-0.5,
+                            chunksize=2000):
     '''
     Process the samples by replicate returning
     a dataframe of the alignment of each sampled sequence
     against their cluster representative.
+
+    With `workers > 1`, pairs are aligned in a pool of processes, in
+    chunks of `chunksize` pairs. With `score_only`, only the score and
+    e-value of each alignment are computed (identity, gap_identity,
+    coverage and aln_len are left empty).
     '''
     import pandas as pd
-    out = []
-    for record in sample_df.itertuples():
-        sid, gid, cov, score, lent = aln(record.sequence_x,
-                                         record.sequence_y, -10, -0.5)
-        evalue = f_evalue(record.sequence_x, score)
-        out.append([record._1,
-                    record._4,
-                    sid,
-                    gid,
-                    cov,
-                    score,
-                    lent,
-                    evalue,
-                    record.family])
-    out = pd.DataFrame(out, columns=['query',
-                                     'target',
-                                     'identity',
-                                     'gap_identity',
-                                     'coverage',
-                                     'score',
-                                     'aln_len',
-                                     'evalue',
-                                     'family'])
+    from concurrent.futures import ProcessPoolExecutor
+    pairs = list(zip(sample_df.sequence_x, sample_df.sequence_y))
+    tasks = [(pairs[i:i+chunksize], gap_open, gap_extend, score_only)
+             for i in range(0, len(pairs), chunksize)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            res = list(executor.map(_align_pairs, tasks))
+    else:
+        res = [_align_pairs(t) for t in tasks]
+    out = pd.DataFrame([r for chunk in res for r in chunk],
+                       columns=['identity',
+                                'gap_identity',
+                                'coverage',
+                                'score',
+                                'aln_len',
+                                'evalue'])
+    out.insert(0, 'query', sample_df['AMP accession_x'].values)
+    out.insert(1, 'target', sample_df['AMP accession_y'].values)
+    out['family'] = sample_df['family'].values
     out['sig.'] = out['evalue'].apply(lambda x: '*' if x < 1e-5 else 'n.s.')
     return out
 
 
-def cluster_analysis():
+def cluster_analysis(n=3000, workers=1, score_only=False):
+    '''
+    Align `n` members of non-singleton clusters (all of them if `n` is
+    None) against their representatives, at each clustering level
+    '''
     import pandas as pd
     print('load info')
     clusters = clusters_load()
@@ -214,7 +320,7 @@ def cluster_analysis():
         sampled = sample_seqs(clusters,
                                  rep,
                                  level,
-                                 3000)
+                                 n)
         sampled = clusters[clusters['AMP accession'].isin(sampled)]
         cols = ['AMP accession',
                   f'SPHERE_fam level {level}',
@@ -225,12 +331,33 @@ def cluster_analysis():
                        right=repdata[cols])
         sampled.rename(columns={f'SPHERE_fam level {level}': 'family'},
                         inplace=True)
-        sampled = align_to_representative(sampled)
+        sampled = align_to_representative(sampled,
+                                          workers=workers,
+                                          score_only=score_only)
         sampled.to_csv(f'outputs/output_clustering_significance_level{level}.tsv',
                   sep='\t',
                   header=True,
                   index=None)
 
 if __name__ == '__main__':
-    cluster_analysis()
+    import argparse
+    parser = argparse.ArgumentParser(description='Significance of AMPSphere clusters')
+    parser.add_argument('--samples',
+                        type=int,
+                        default=3000,
+                        help='number of cluster members aligned per level')
+    parser.add_argument('--all',
+                        action='store_true',
+                        help='align all cluster members instead of a sample')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='number of processes used for the alignments')
+    parser.add_argument('--score-only',
+                        action='store_true',
+                        help='only compute scores and e-values')
+    args = parser.parse_args()
+    cluster_analysis(n=None if args.all else args.samples,
+                     workers=args.workers,
+                     score_only=args.score_only)
 
@@ -2,36 +2,45 @@ import pandas as pd
 import numpy as np
 from jug import TaskGenerator
 
+GAP_SETTINGS = [
+    (-10, -.5),
+    ( -9,  -1),
+    (-11,  -1),
+    ( -5, -.5),
+    ( -5,  -1),
+    ( -1,  -1),
+    (  0,   0),
+    ]
+
 
 @TaskGenerator
-def recalculated_evalue(level, gap_open, gap_extend):
+def recalculated_evalues(level):
+    '''
+    E-values of the alignments of a clustering level for all gap settings
+
+    Pairs and sequences are loaded once, and all settings are scored in a
+    single pass by alignment_sweep, which only aligns the pairs missing
+    from the cache of each setting (shared by all levels)
+    '''
     import pandas as pd
-    from utils import clustering_analysis
-    from Bio.pairwise2 import align
-    import Bio.Align.substitution_matrices as mt
     import numpy as np
-    mapped = pd.read_table(f'../../data_folder/output_clustering_significance_level{level}.tsv.gz')
-    sequences = clustering_analysis.seqload()
-
-    re_calc_evalue = []
-    for ix in range(len(mapped)):
-        seq1 = sequences[mapped.iloc[ix]['query']]
-        seq2 = sequences[mapped.iloc[ix]['target']]
-
-        if gap_open < 0 or gap_extend < 0:
-            alignments = align.globalds(seq1,
-                                        seq2,
-                                        mt.load('BLOSUM62'),
-                                        gap_open,
-                                        gap_extend)
-        else:
-            alignments = align.globaldx(seq1,
-                                        seq2,
-                                        mt.load('BLOSUM62'))
-        aligned_A, aligned_B, score, begin, end = alignments[0]
-        re_calc_evalue.append(clustering_analysis.f_evalue(seq1, score, (gap_open != 0 or gap_extend != 0)))
-
-    return np.array(re_calc_evalue)
+    from cluster_significance import seqload, f_evalue
+    from alignment_sweep import sweep
+    mapped = pd.read_table(f'../../data_folder/output_clustering_significance_level{level}.tsv.gz',
+                           usecols=['query', 'target'])
+    pairs = list(zip(mapped['query'], mapped['target']))
+    sequences = seqload()
+
+    evalues = {}
+    for (gap_open, gap_extend), scores in sweep(pairs, sequences, GAP_SETTINGS).items():
+        gapped = (gap_open != 0 or gap_extend != 0)
+        evalues[gap_open, gap_extend] = np.array([f_evalue(sequences[q], s, gapped)
+                                                  for (q, _), s in zip(pairs, scores)])
+    return evalues
+
+@TaskGenerator
+def setting_evalues(evalues, gap_open, gap_extend):
+    return evalues[gap_open, gap_extend]
 
 @TaskGenerator
 def summarize(r):
@@ -45,16 +54,9 @@ def write_out(final):
 
 results = {}
 for level in ['I', 'II', 'III']:
-    for gap_open, gap_extend in [
-        (-10, -.5),
-        ( -9,  -1),
-        (-11,  -1),
-        ( -5, -.5),
-        ( -5,  -1),
-        ( -1,  -1),
-        (  0,   0),
-        ]:
-        results[level, gap_open, gap_extend] = recalculated_evalue(level, gap_open, gap_extend)
+    evalues = recalculated_evalues(level)
+    for gap_open, gap_extend in GAP_SETTINGS:
+        results[level, gap_open, gap_extend] = setting_evalues(evalues, gap_open, gap_extend)
 
 final = summarize(results)
 write_out(final)
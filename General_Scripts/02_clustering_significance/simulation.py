@@ -35,14 +35,9 @@ def mass_comp(seqlist):
 def simseq(n):
     import random
     from numpy import mean, std
-    minalph = {'L': ['L', 'V', 'M', 'I', 'C'],
-               'A': ['A', 'G'],
-               'S': ['S', 'T'],
-               'P': ['P'],
-               'F': ['F', 'W', 'Y'],
-               'E': ['E', 'D', 'Q', 'N'],
-               'K': ['K', 'R'],
-               'H': ['H']}
+    from alphabets import groups
+    # L, A, S, P, F, E, K, H
+    minalph = groups('8')
     s = random.choices(list(minalph.keys()), weights=[5, 2, 2, 1, 3, 4, 2, 1], k=n)
     s = ''.join(s)
     transl = [minalph[i] for i in s]
@@ -18,23 +18,18 @@ def check_sense(seq):
     
           
 def load_nts():
-    import lzma
     import pandas as pd
-    from Bio import SeqIO
+    from seqstore import load_index, iter_records
 
-    infile = lzma.open('data/AMPSphere_v.2022-03.fna.xz',
-                       'rt',
-                       encoding='utf-8')
+    index = load_index('data/AMPSphere_v.2022-03.fna.xz')
     data = []
-    for record in SeqIO.parse(infile, 'fasta'):
-        print(record.description)
-        record.seq = str(record.seq)
-        n = record.description.split(' | ')
-        if check_sense(record.seq):
-            record.seq = revcomp(record.seq)
-        data.append([n[0],
-                     n[1],
-                     str(record.seq)])
+    for gmsc, amp, seq in iter_records(index):
+        print(f'{gmsc} | {amp}')
+        if check_sense(seq):
+            seq = revcomp(seq)
+        data.append([gmsc,
+                     amp,
+                     seq])
 
     data = pd.DataFrame(data,
                         columns=['gmsc',
@@ -1,3 +1,5 @@
+import os
+
 from utils.qualtest import quality
 from utils.ugenes import ugenes_plot
 from utils.AMPfeatures import amplen
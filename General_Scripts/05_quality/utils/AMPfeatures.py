@@ -3,21 +3,18 @@ def amplen():
     AMP features distribution
     in AMPSphere
     '''
-    import gzip
+    import numpy as np
     import pandas as pd
     import matplotlib.pyplot as plt
 
-    from Bio import SeqIO
+    from seqstore import load_index
     
     
     print('... loading features')
     data = pd.DataFrame()
-    Lamp = []
-    with gzip.open('data/AMPSphere_v.2022-03.faa.gz', 'rt', encoding='utf-8') as ifile:
-        for record in SeqIO.parse(ifile, 'fasta'):
-            Lamp.append(len(record.seq))
-            
-    data['length'] = Lamp
+    # lengths come straight from the offsets of the sequence index
+    index = load_index('data/AMPSphere_v.2022-03.faa.gz')
+    data['length'] = np.diff(index['offsets'])
 
     # preparing the histogram of isolectric points
     data.length.hist(bins=100, grid=False)
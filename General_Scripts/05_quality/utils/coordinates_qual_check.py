@@ -1,13 +1,6 @@
 def returngenes():
-    import lzma
-    from Bio import SeqIO
-    seqs = dict()
-    for record in SeqIO.parse(lzma.open('data/AMPSphere_v.2022-03.fna.xz',
-                                        'rt'),
-                              'fasta'):
-        x = record.description.split(' | ')
-        seqs[x[0]] = x[1]
-    return seqs
+    from seqstore import labeldict
+    return labeldict('data/AMPSphere_v.2022-03.fna.xz')
 
 
 def recovergmsc(x, seqs):
@@ -2,14 +2,10 @@ def getref():
     '''
     Quick function to load file once
     '''
-    import pandas as pd
+    from tables import load_table
     
-    ref = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                        sep='\t',
-                        header='infer',
-                        low_memory=False)
-                        
-    ref = ref[['gmsc', 'amp']]
+    ref = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                     columns=['gmsc', 'amp'])
     return ref
     
     
@@ -3,21 +3,19 @@ def ugenes_plot():
     Plot the number of AMPs by the number of unique genes
     they are encoded by
     '''
-    import lzma
     import pandas as pd
     import numpy as np
     import matplotlib.pyplot as plt
     
-    from Bio import SeqIO
     from collections import Counter
+    from seqstore import load_index, iter_records
 
 
     print('Loading the genes')
     headers, seqs = [], []
-    with lzma.open('data/AMPSphere_v.2022-03.fna.xz', 'rt') as infile:
-        for record in SeqIO.parse(infile, 'fasta'):
-            headers.append(record.description.split(' | ')[1])
-            seqs.append(str(record.seq))
+    for _, amp, seq in iter_records(load_index('data/AMPSphere_v.2022-03.fna.xz')):
+        headers.append(amp)
+        seqs.append(seq)
 
     print('Generating a table with sequence and AMP headers')
     df = pd.DataFrame(np.array([headers, seqs]).T, columns=['AMP', 'gene'])
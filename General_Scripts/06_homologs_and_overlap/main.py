@@ -1,3 +1,5 @@
+import os
+
 #from utils.download_files import inputsgen
 from utils.mundi_map import plot_mundi_map
 from utils.homologs import homologs
@@ -21,19 +23,40 @@ def organize_files():
 
 
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Homologs and overlap of AMPs')
+    parser.add_argument('--threads',
+                        type=int,
+                        default=None,
+                        help='threads used by the GMGC search (all cpus '
+                             'by default)')
+    parser.add_argument('--threads-per-search',
+                        type=int,
+                        default=3,
+                        help='threads of each concurrent GMGC chunk search')
+    parser.add_argument('--memory-gb',
+                        type=int,
+                        default=None,
+                        help='memory (GB) shared by the concurrent GMGC '
+                             'chunk searches (no limit by default)')
+    args = parser.parse_args()
+
 #    print('Retrieving inputs')
 #    inputsgen()
     print('Generating figure 1A')
     plot_mundi_map()
     print('Generating data for figure 1B')
-    homologs()
+    homologs(threads=args.threads,
+             threads_per_search=args.threads_per_search,
+             memory_gb=args.memory_gb)
     print('Generating figure 1C')
     heatmap_environments()
     print('Generating figure 1D')
     heatmap_bodysites()
     print('Homologs search per db/quality')
     dha()
-    print('Overlap AMPs in mammalian guts'
+    print('Overlap AMPs in mammalian guts')
     heatmap_mammal_guts()
         
     
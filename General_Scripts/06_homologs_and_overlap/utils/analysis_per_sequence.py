@@ -1,35 +1,36 @@
 def homologs_search_per_db():
+    import os
     import pandas as pd
+    from .homologs import HOMOLOG_DBS, N_AMPS, amp_accession
     
     infolder = 'analysis/homologs'
     
-    dramp = pd.read_table(f'{infolder}/dramp_candidates.txt', header=None)
-    gmgc = pd.read_table(f'{infolder}/gmgc_candidates.txt', header=None)
-    smprot = pd.read_table(f'{infolder}/SmProt_candidates.txt', header=None)
-    starpep = pd.read_table(f'{infolder}/starPepDB_candidates.txt', header=None)
-    STsorfs = pd.read_table(f'{infolder}/STsORFs_candidates.txt', header=None)
-    
-    def formatname(x):
-        x = str(x).zfill(6)
-        return '_'.join([x[idx:idx + 3]
-                         for idx, val in enumerate(x) if idx % 3 == 0])
-    
-    all_amps = [ f'AMP10.{formatname(x)}' for x in range(863499)]
-    df = pd.DataFrame(all_amps, columns=['AMPSphere'])
-    df[['DRAMP', 'GMGCv1', 'SmProtv2', 'StarPepDB45k', 'STsORFs']] = False
-    
-    df = df.set_index('AMPSphere')
-    df.loc[dramp[0], 'DRAMP'] = True
-    df.loc[gmgc[0], 'GMGCv1'] = True
-    df.loc[smprot[0], 'SmProtv2'] = True
-    df.loc[starpep[0], 'StarPepDB45k'] = True
-    df.loc[STsorfs[0], 'STsORFs'] = True
-    df = df.reset_index()
-    
-    df.to_csv(f'{infolder}/homologs_table.tsv',
-              sep='\t',
-              header=True,
-              index=None)
+    if os.path.exists(f'{infolder}/homologs_table.tsv'):
+        # written by homologs.compare_hits
+        df = pd.read_table(f'{infolder}/homologs_table.tsv')
+    else:
+        dramp = pd.read_table(f'{infolder}/dramp_candidates.txt', header=None)
+        gmgc = pd.read_table(f'{infolder}/gmgc_candidates.txt', header=None)
+        smprot = pd.read_table(f'{infolder}/SmProt_candidates.txt', header=None)
+        starpep = pd.read_table(f'{infolder}/starPepDB_candidates.txt', header=None)
+        STsorfs = pd.read_table(f'{infolder}/STsORFs_candidates.txt', header=None)
+        
+        all_amps = [amp_accession(x) for x in range(N_AMPS)]
+        df = pd.DataFrame(all_amps, columns=['AMPSphere'])
+        df[HOMOLOG_DBS] = False
+        
+        df = df.set_index('AMPSphere')
+        df.loc[dramp[0], 'DRAMP'] = True
+        df.loc[gmgc[0], 'GMGCv1'] = True
+        df.loc[smprot[0], 'SmProtv2'] = True
+        df.loc[starpep[0], 'StarPepDB45k'] = True
+        df.loc[STsorfs[0], 'STsORFs'] = True
+        df = df.reset_index()
+        
+        df.to_csv(f'{infolder}/homologs_table.tsv',
+                  sep='\t',
+                  header=True,
+                  index=None)
     
     df.DRAMP = ['DRAMP' if x == True else '' for x in df.DRAMP]
     df.GMGCv1 = ['GMGCv1' if x == True else '' for x in df.GMGCv1]
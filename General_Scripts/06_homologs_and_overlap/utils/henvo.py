@@ -3,6 +3,8 @@ def heatmap_environments():
     Create a heatmap of the shared environmental AMP contents
     '''
     import pandas as pd
+    from tables import load_table
+    from .incidence import habitat_overlaps
     import numpy as np
     import seaborn as sns
     import matplotlib.pyplot as plt
@@ -39,52 +41,22 @@ def heatmap_environments():
     wastewater = ['wastewater', 'activated sludge']
     
     print('loading data')
-    data = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                         sep='\t',
-                         header='infer')
+    data = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                      columns=['amp', 'general_envo_name'])
 
-    # filtering data by environmental sets:
-    non_mammal = set(data[data['general_envo_name'].isin(non_mammalian_host)]['amp'])
-    mammal_gut = set(data[data['general_envo_name'].isin(mammalian_host_guts)]['amp'])
-    mammal_others = set(data[data['general_envo_name'].isin(mammalian_host_other)]['amp'])
-    built_environment = set(data[data['general_envo_name'].isin(built_environment)]['amp']) 
-    freshwater = set(data[data['general_envo_name'].isin(freshwater)]['amp'])
-    wastewater = set(data[data['general_envo_name'].isin(wastewater)]['amp']) 
-    plant_associated = set(data[data['general_envo_name'] == 'plant associated']['amp']) 
-    marine = set(data[data['general_envo_name'] == 'marine']['amp'])
-    soil = set(data[data['general_envo_name'] == 'soil']['amp']) 
-
-    # create dictionary of names by position
-    posix_dic = {0: 'non_mammal',
-                 1: 'mammal_gut',
-                 2: 'mammal_others',
-                 3: 'marine',
-                 4: 'soil',
-                 5: 'built_environment',
-                 6: 'freshwater',
-                 7: 'wastewater',
-                 8: 'plant_associated'}
+    # environmental sets
+    groups = {'non_mammal': non_mammalian_host,
+              'mammal_gut': mammalian_host_guts,
+              'mammal_others': mammalian_host_other,
+              'marine': ['marine'],
+              'soil': ['soil'],
+              'built_environment': built_environment,
+              'freshwater': freshwater,
+              'wastewater': wastewater,
+              'plant_associated': ['plant associated']}
 
     # computing intersections over pairs of environments
-    matrix = [[],[],[],[],[],[],[],[],[]]
-    setlists = [non_mammal,
-                mammal_gut,
-                mammal_others,
-                marine,
-                soil,
-                built_environment,
-                freshwater,
-                wastewater,
-                plant_associated]
-    for n, i in enumerate(setlists):
-        matrix[n].append(posix_dic[n])
-        for m, j in enumerate(setlists):
-            matrix[n].append(len(i.intersection(j)))
-
-    # convert overlap info into a dataframe
-    df = pd.DataFrame(np.array(matrix)).set_index(0)
-    df.columns = posix_dic.values()
-    df = df.astype('int')
+    df = habitat_overlaps(data, groups)
 
     # create mask of zeros
     mask = np.zeros_like(df)
@@ -3,10 +3,11 @@ def heatmap_environments():
     Create a heatmap of the shared environmental AMP contents
     '''
     import pandas as pd
+    from tables import load_table
+    from .incidence import habitat_incidence, group_incidence, cooccurrence
     import numpy as np
     import seaborn as sns
     import matplotlib.pyplot as plt
-    from itertools import chain
     
     
     # creating sets of environments
@@ -85,34 +86,26 @@ def heatmap_environments():
         }
     
     print('loading data')
-    data = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                         sep='\t',
-                         header='infer')
+    data = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                      columns=['amp', 'general_envo_name'],
+                      filters=[('is_metagenomic', '==', True)])
 
-    # filter duplicates
-    data = data[data.is_metagenomic == True]
-    data = data[['amp', 'general_envo_name']].drop_duplicates()
-    data = data.groupby('general_envo_name')['amp'].apply(lambda x: set(x))
+    # AMPs per environment
+    matrix, _, habitats = habitat_incidence(data)
+    sizes = np.asarray(matrix.sum(axis=0)).ravel()
 
     # add environments with at least 100 peptides
-    data = data.apply(lambda x: x if len(x) >= 100 else 'NA')
-    data = data[~data.isin(['NA'])]
-
-    # convert to higher level
-    data = data.reset_index()
-    data['general_envo_name'] = data['general_envo_name'].apply(lambda x: higher_level.get(x, 'other'))
-    data = data.groupby('general_envo_name')['amp'].apply(lambda x: set(chain.from_iterable(x)))
+    # converted to higher level
+    groups = dict()
+    for h, n in zip(habitats, sizes):
+        if n >= 100:
+            groups.setdefault(higher_level.get(h, 'other'), []).append(h)
+    groups = dict(sorted(groups.items()))
 
     # calculate overlap
-    df = []
-    for i in data.index:
-        for j in data.index:
-            n = data.loc[i].intersection(data.loc[j])
-            n = len(n)
-            df.append((i, j, n))
-
-    df = pd.DataFrame(df, columns=['env1', 'env2', 'overlap'])
-    df = df.pivot(index='env1', columns='env2', values='overlap')
+    grouped = group_incidence(matrix, habitats, groups)
+    df = cooccurrence(grouped, list(groups))
+    df = df.rename_axis(index='env1', columns='env2')
 
     # normalize
     for c in df:
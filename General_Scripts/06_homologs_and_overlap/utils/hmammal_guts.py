@@ -4,47 +4,28 @@ def heatmap_mammal_guts():
     different mammalian guts
     '''
     import pandas as pd
+    from tables import load_table
+    from .incidence import habitat_overlaps
     import numpy as np
     import seaborn as sns
     import matplotlib.pyplot as plt
     
 
     print('Load data')
-    data = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                         sep='\t',
-                         header='infer')
-
-    print('# getting AMP lists for each host')
-    human_gut = set(data[data['general_envo_name'].isin(['human gut'])]['amp'].tolist())
-    pig_gut = set(data[data['general_envo_name'].isin(['pig gut'])]['amp'].tolist())
-    chicken_gut = set(data[data['general_envo_name'].isin(['chicken gut'])]['amp'].tolist())
-    mouse_gut = set(data[data['general_envo_name'].isin(['mouse gut'])]['amp'].tolist())
-    dog_gut = set(data[data['general_envo_name'].isin(['dog gut'])]['amp'].tolist())
-    cat_gut = set(data[data['general_envo_name'].isin(['cat gut'])]['amp'].tolist())
-    bovine_gut = set(data[data['general_envo_name'].isin(['cattle gut'])]['amp'].tolist())
+    data = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                      columns=['amp', 'general_envo_name'])
 
     # stating hosts
-    posix_dic = {0: 'human_gut',
-                 1: 'pig_gut',
-                 2: 'chicken_gut',
-                 3: 'mouse_gut',
-                 4: 'cat_gut',
-                 5: 'dog_gut',
-                 6: 'bovine_gut'}
+    groups = {'human_gut': ['human gut'],
+              'pig_gut': ['pig gut'],
+              'chicken_gut': ['chicken gut'],
+              'mouse_gut': ['mouse gut'],
+              'cat_gut': ['cat gut'],
+              'dog_gut': ['dog gut'],
+              'bovine_gut': ['cattle gut']}
 
     # calculating overlaps
-    matrix = [[],[],[],[],[],[],[]]
-    setlists = [human_gut, pig_gut, chicken_gut, mouse_gut, cat_gut, dog_gut, bovine_gut]
-
-    for n, i in enumerate(setlists):
-        matrix[n].append(posix_dic[n])
-        for m, j in enumerate(setlists):
-            matrix[n].append(len(i.intersection(j)))
-
-    # converting overlap info into a dataframe
-    df = pd.DataFrame(np.array(matrix)).set_index(0)
-    df.columns = posix_dic.values()
-    df = df.astype('int')
+    df = habitat_overlaps(data, groups)
     df_perc = round(df * 100 / df.max(axis=1), 2)
     
     # creat mask of zeros
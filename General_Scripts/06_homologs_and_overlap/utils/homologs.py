@@ -53,7 +53,7 @@ def batch_iterator(iterator, batch_size):
         batch = []
         while len(batch) < batch_size:
             try:
-                entry = iterator.next()
+                entry = next(iterator)
             except StopIteration:
                 entry = None
             if entry is None:
@@ -64,27 +64,203 @@ def batch_iterator(iterator, batch_size):
             yield batch
 
 
-def split_GMGC10():
+GMGC_CHUNKS = 'data/databases_homology/gmgc_chunks'
+GMGC_SEARCH = 'analysis/homologs/gmgc'
+
+
+def split_GMGC10(outdir=GMGC_CHUNKS, batch_size=1_000_000):
     '''
     Split large GMGC database into smaller chunks
+
+    The list of chunks is written to <outdir>/chunks.txt once all of
+    them are complete, and the splitting is skipped if it exists
+
+    :output:
+    - list of chunk names
     '''
     from Bio import SeqIO
     import os
 
     gmgc_address = 'data/databases_homology/GMGC10.proGenomes.faa'
-    outdir = 'data/databases_homology/gmgc_chunks/'
+    index = f'{outdir}/chunks.txt'
+    if os.path.exists(index):
+        with open(index) as f:
+            return f.read().split()
 
     os.makedirs(outdir, exist_ok=True)
 
+    chunks = []
     record_iter = SeqIO.parse(open(gmgc_address), 'fasta')
-    for i, batch in enumerate(batch_iterator(record_iter, 1_000_000)):
+    for i, batch in enumerate(batch_iterator(record_iter, batch_size)):
         filename = f'group_{i+1}.fasta'
         with open(f'{outdir}/{filename}', 'w') as handle:
             count = SeqIO.write(batch, handle, 'fasta')
         print(f'Wrote {count} records to {filename}')
+        chunks.append(filename.replace('.fasta', ''))
+
+    with open(f'{index}.tmp', 'w') as f:
+        for c in chunks:
+            f.write(f'{c}\n')
+    os.replace(f'{index}.tmp', index)
+    return chunks
+
+
+def read_manifest(manifest):
+    '''
+    Chunks already searched (and their number of significant hits)
+    '''
+    import os
+    done = dict()
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            for row in f:
+                chunk, hits = row.split()
+                done[chunk] = int(hits)
+    return done
+
+
+def filter_hits(infile, ofile, evalue=1e-5):
+    '''
+    Copy the rows of a m8 file with evalue (3rd column) of at most
+    `evalue`, returning their number
+    '''
+    import os
+    hits = 0
+    with open(infile) as fin, open(f'{ofile}.tmp', 'w') as fout:
+        for row in fin:
+            if float(row.split('\t', 3)[2]) <= evalue:
+                fout.write(row)
+                hits += 1
+    os.replace(f'{ofile}.tmp', ofile)
+    return hits
+
+
+def search_chunk(chunk, querydb, threads, memory=None):
+    '''
+    Search the AMPSphere database against a GMGC chunk, keeping only
+    the significant hits in <GMGC_SEARCH>/<chunk>.m8
 
+    Intermediate databases are removed afterwards
 
-def search_GMGC(ask):
+    :output:
+    - number of significant hits
+    '''
+    import os
+    import shutil
+    import subprocess
+    formlist = ['query', 'target', 'evalue',
+                'gapopen', 'pident', 'nident',
+                'qstart', 'qend', 'qlen',
+                'tstart', 'tend', 'tlen',
+                'alnlen', 'raw', 'bits',
+                'cigar', 'qseq', 'tseq',
+                'qheader', 'theader', 'qaln',
+                'taln', 'qframe', 'tframe',
+                'mismatch', 'qcov', 'tcov']
+    work = f'{GMGC_SEARCH}/{chunk}_work'
+    os.makedirs(work, exist_ok=True)
+    limits = ['--split-memory-limit', memory] if memory else []
+    commands = [['mmseqs', 'createdb',
+                 f'{GMGC_CHUNKS}/{chunk}.fasta',
+                 f'{work}/target'],
+                ['mmseqs', 'search',
+                 querydb,
+                 f'{work}/target',
+                 f'{work}/aln',
+                 f'{work}/tmp',
+                 '--threads', str(threads)] + limits,
+                ['mmseqs', 'convertalis',
+                 querydb,
+                 f'{work}/target',
+                 f'{work}/aln',
+                 f'{work}/result.m8',
+                 '--threads', str(threads),
+                 '--format-output', ','.join(formlist)]]
+    for command in commands:
+        if subprocess.call(command) != 0:
+            raise RuntimeError(f'{command[1]} failed for {chunk}')
+    hits = filter_hits(f'{work}/result.m8', f'{GMGC_SEARCH}/{chunk}.m8')
+    shutil.rmtree(work)
+    return hits
+
+
+def run_GMGC_search(threads=None, threads_per_search=3, memory_gb=None):
+    '''
+    Search AMPSphere against all GMGC chunks
+
+    The query database is created once, and chunks are searched
+    concurrently, `threads_per_search` threads each, without exceeding
+    `threads` threads (all cpus by default) nor `memory_gb` GB of memory
+    in total. Every completed chunk is recorded in a manifest, so that
+    an interrupted run resumes from the chunks left. When all chunks are
+    done, their significant hits are merged into result_gmgc.m8
+
+    :output:
+    - True if all chunks were searched
+    '''
+    import os
+    import shutil
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    chunks = split_GMGC10()
+    os.makedirs(GMGC_SEARCH, exist_ok=True)
+
+    querydb = f'{GMGC_SEARCH}/querydb/ampsphere'
+    if not os.path.exists(f'{querydb}.done'):
+        os.makedirs(os.path.dirname(querydb), exist_ok=True)
+        if subprocess.call(['mmseqs', 'createdb',
+                            'data/AMPSphere_v.2022-03.faa.gz',
+                            querydb]) != 0:
+            raise RuntimeError('could not create the AMPSphere database')
+        open(f'{querydb}.done', 'w').close()
+
+    manifest = f'{GMGC_SEARCH}/manifest.tsv'
+    done = read_manifest(manifest)
+    todo = [c for c in chunks if c not in done]
+    print(f'{len(done)} GMGC chunks already searched, {len(todo)} to go')
+
+    threads = threads or os.cpu_count()
+    threads_per_search = min(threads_per_search, threads)
+    workers = max(1, threads // threads_per_search)
+    memory = None
+    if memory_gb:
+        workers = max(1, min(workers, memory_gb))
+        memory = f'{memory_gb // workers}G'
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            open(manifest, 'a') as fman:
+        futures = {executor.submit(search_chunk, c, querydb,
+                                   threads_per_search, memory): c
+                   for c in todo}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                hits = future.result()
+            except Exception as e:
+                print(f'Search of {chunk} failed: {e}')
+                failed.append(chunk)
+                continue
+            fman.write(f'{chunk}\t{hits}\n')
+            fman.flush()
+            os.remove(f'{GMGC_CHUNKS}/{chunk}.fasta')
+            print(f'{chunk}: {hits} significant hits')
+
+    if failed:
+        print(f'{len(failed)} chunks failed, run again to resume')
+        return False
+
+    with open('analysis/homologs/result_gmgc.m8.tmp', 'wb') as ofile:
+        for chunk in chunks:
+            with open(f'{GMGC_SEARCH}/{chunk}.m8', 'rb') as f:
+                shutil.copyfileobj(f, ofile)
+    os.replace('analysis/homologs/result_gmgc.m8.tmp',
+               'analysis/homologs/result_gmgc.m8')
+    return True
+
+
+def search_GMGC(ask, threads=None, threads_per_search=3, memory_gb=None):
     '''
     Performs the searching of AMPSphere against GMGC
     or in case user preferes, it can just skip this
@@ -92,57 +268,16 @@ def search_GMGC(ask):
 
     :input: ask - str. Y or N to use the pre-computed
                   resource
+            threads, threads_per_search, memory_gb - resources of the
+                  search (see run_GMGC_search)
+
+    :output: True if result_gmgc.m8 is complete, False if some chunks
+             of the search failed (or `ask` is neither Y nor N)
     '''
-    import os
-    import glob
     import lzma
-    import subprocess
-    import pandas as pd
-
-    formlist=['query', 'target', 'evalue',
-        'gapopen', 'pident', 'nident',
-        'qstart', 'qend', 'qlen',
-        'tstart', 'tend', 'tlen',
-        'alnlen', 'raw', 'bits',
-        'cigar', 'qseq', 'tseq',
-        'qheader', 'theader', 'qaln',
-        'taln', 'qframe', 'tframe',
-        'mismatch', 'qcov', 'tcov']
 
     if (ask == 'N') or (ask == 'n'):
-        print('Splitting the large GMGC file into small chunks')
-        split_GMGC10()
-
-        outdir = 'analysis/homologs/gmgc/'
-        os.makedirs(outdir, exist_ok=True)
-
-        for chunk in glob.glob('data/databases_homology/gmgc_chunks/*.fasta'):
-            outfile = chunk.split('/')[-1].replace('.fasta', '.m8')
-            subprocess.call(['mmseqs',
-                             'easy-search',
-                             'data/AMPSphere_v.2022-03.faa.gz',
-                             chunk,
-                             f'{outdir}/{outfile}',
-                             'tmp',
-                             '--disk-space-limit 5G',
-                             '--db-load-mode 3',
-                             '--threads 3',
-                             '--format-output',
-                             ','.join(formlist)])
-
-        df = pd.DataFrame()
-        for chunk in glob.glob(f'{outdir}/*.m8'):
-            dint = pd.DataFrame(chunk, sep='\t', header=None)
-            dint = dint[dint[2] <= 1e-5]
-            df = pd.concat([df, dint])
-
-        df.to_csv('analysis/homologs/result_gmgc.m8',
-                  sep='\t',
-                  header=None,
-                  index=None)
-
-        os.remove('analysis/homologs/gmgc')
-        os.remove('data/databases_homology/gmgc_chunks')
+        return run_GMGC_search(threads, threads_per_search, memory_gb)
 
     if (ask == 'Y') or (ask == 'y'):
         with  lzma.open('data/databases_homology/true_pep_2022_vs_progenomesgmgc.tsv.xz',
@@ -151,40 +286,152 @@ def search_GMGC(ask):
             with open('analysis/homologs/result_gmgc.m8', 'w') as ofile:
                 for row in infile:
                     ofile.write(row)
+        return True
+    return False
+
+
+DB_LABELS = {'dramp': 'DRAMP',
+             'starPepDB': 'StarPepDB45k',
+             'SmProt': 'SmProtv2',
+             'STsORFs': 'STsORFs',
+             'gmgc': 'GMGCv1'}
+
+# columns of homologs_table.tsv, in order
+HOMOLOG_DBS = ['DRAMP', 'GMGCv1', 'SmProtv2', 'StarPepDB45k', 'STsORFs']
+
+# number of AMPs in AMPSphere v.2022-03
+N_AMPS = 863_499
+
+
+def amp_code(accession):
+    '''
+    Integer code of an AMPSphere accession (AMP10.000_000 -> 0)
+    '''
+    return int(accession[6:9] + accession[10:13])
+
+
+def amp_accession(code):
+    '''
+    AMPSphere accession of an integer code (0 -> AMP10.000_000)
+    '''
+    return f'AMP10.{code // 1000:03d}_{code % 1000:03d}'
+
+
+def significant_queries(infile, evalue=1e-5, chunksize=1_000_000):
+    '''
+    Integer codes of the AMPs with hits of at most `evalue` in a
+    mmseqs m8 output
+
+    Only the query and evalue columns are parsed, in chunks, so that
+    alignments are never kept in memory. An empty file has no hits
+    '''
+    import numpy as np
+    import pandas as pd
+    found = [np.zeros(0, dtype=np.int64)]
+    try:
+        for chunk in pd.read_table(infile,
+                                   header=None,
+                                   usecols=[0, 2],
+                                   names=['query', 'evalue'],
+                                   chunksize=chunksize):
+            queries = chunk['query'][chunk['evalue'] <= evalue].unique()
+            found.append(np.array([amp_code(q) for q in queries], dtype=np.int64))
+    except pd.errors.EmptyDataError:
+        pass
+    return np.unique(np.concatenate(found))
+
+
+def hit_bitsets(infiles, evalue=1e-5):
+    '''
+    Bitset of databases with hits for each AMP, where bit i is set if
+    the AMP has hits in infiles[i]
+
+    :output:
+    - array indexed by the AMP integer code
+    '''
+    import numpy as np
+    masks = np.zeros(0, dtype=np.uint32)
+    for i, infile in enumerate(infiles):
+        print(infile)
+        codes = significant_queries(infile, evalue)
+        if len(codes) and codes[-1] >= len(masks):
+            masks = np.pad(masks, (0, codes[-1] + 1 - len(masks)))
+        masks[codes] |= np.uint32(1 << i)
+    return masks
+
+
+def homologs_table(masks, names, n_amps=N_AMPS):
+    '''
+    Table of all AMPs (column AMPSphere) and whether they have homologs in
+    each database of HOMOLOG_DBS (boolean columns, in that order)
+
+    :input:
+    - masks     bitsets from hit_bitsets
+    - names     database of each bit (as in the names of the m8 files)
+    '''
+    import numpy as np
+    import pandas as pd
+    masks = np.pad(masks, (0, max(0, n_amps - len(masks))))
+    table = pd.DataFrame({'AMPSphere': [amp_accession(c) for c in range(n_amps)]})
+    for db in HOMOLOG_DBS:
+        table[db] = False
+    for i, oname in enumerate(names):
+        db = DB_LABELS.get(oname, oname)
+        if db in HOMOLOG_DBS:
+            table[db] = (masks[:n_amps] & (1 << i)) > 0
+    return table
 
 
 def compare_hits():
     '''
     Compare the hits obtained querying AMPSphere against different databases
+
+    Writes the candidates with homologs in each database, all annotated
+    candidates, the table of databases with homologs for every AMP
+    (homologs_table.tsv, also used by
+    analysis_per_sequence.homologs_search_per_db) and the number of
+    annotated AMPs in each combination of databases (homologs_venn.tsv)
     '''
+    import numpy as np
     import pandas as pd
     from glob import glob
+    infiles = sorted(glob('analysis/homologs/*.m8'))
+    names = [f.split('/')[-1].replace('.m8', '').replace('result_', '')
+             for f in infiles]
+    masks = hit_bitsets(infiles)
+
     ofile = open('panelB_homologs_search.txt', 'a')
-    all_candidates = set()
-    for chunk in glob('analysis/homologs/*.m8'):
-        print(chunk)
-        homologs = pd.read_table(chunk, header=None)
-        homologs = homologs[homologs[2] <= 1e-5][0]
-        homologs = set(homologs)
-        all_candidates = all_candidates.union(homologs)
-        oname = chunk.split('/')[-1]
-        oname = oname.replace('.m8', '')
-        oname = oname.replace('result_', '')
-        homologs = pd.DataFrame.from_dict(homologs)
-        homologs.to_csv(f'analysis/homologs/{oname}_candidates.txt',
-                        header=None,
-                        index=None)
-        print(f'It was detected in {oname}: {len(homologs)} AMPs with homologs',
+    for i, oname in enumerate(names):
+        codes = np.flatnonzero(masks & (1 << i))
+        with open(f'analysis/homologs/{oname}_candidates.txt', 'w') as out:
+            for c in codes:
+                out.write(f'{amp_accession(c)}\n')
+        print(f'It was detected in {oname}: {len(codes)} AMPs with homologs',
               file=ofile)
-
     ofile.close()
 
-    homologs = pd.DataFrame.from_dict(all_candidates)
-    homologs.to_csv(f'analysis/homologs/annotated_candidates.txt',
-                    header=None,
-                    index=None)
+    codes = np.flatnonzero(masks)
+    all_candidates = [amp_accession(c) for c in codes]
+    with open('analysis/homologs/annotated_candidates.txt', 'w') as out:
+        for amp in all_candidates:
+            out.write(f'{amp}\n')
+
+    table = homologs_table(masks, names)
+    table.to_csv('analysis/homologs/homologs_table.tsv',
+                 sep='\t',
+                 header=True,
+                 index=None)
 
-    return all_candidates
+    # number of annotated AMPs per combination of databases
+    annotated = table[table[HOMOLOG_DBS].any(axis=1)]
+    venn = annotated.drop('AMPSphere', axis=1).value_counts()
+    venn = venn.rename('AMPs').reset_index()
+    venn.to_csv('analysis/homologs/homologs_venn.tsv',
+                sep='\t',
+                header=True,
+                index=None)
+
+    return set(all_candidates)
 
 
 def overlaps(all_candidates):
@@ -217,7 +464,14 @@ def overlaps(all_candidates):
     ofile.close()
 
 
-def homologs():
+def homologs(threads=None, threads_per_search=3, memory_gb=None):
+    '''
+    Search AMPSphere against the homologs databases and compare the hits
+
+    The GMGC search uses at most `threads` threads (all cpus by
+    default), `threads_per_search` for each chunk, and at most
+    `memory_gb` GB of memory in total (see run_GMGC_search)
+    '''
     import os
     from .timeout_input import timeout_input
 
@@ -230,7 +484,8 @@ def homologs():
     Because of that, we made available pre-computed results, if you prefer.
     In case you want to skip the homologs search in GMGC answer y,
     in the opposite case, reply with n.''', 5, 'y')
-    search_GMGC(answ)
+    if not search_GMGC(answ, threads, threads_per_search, memory_gb):
+        raise RuntimeError('GMGC search is incomplete, run again to resume')
     print('Getting all candidates')
     all_candidates = compare_hits()
     print('Generating numbers for Venns Diagram')
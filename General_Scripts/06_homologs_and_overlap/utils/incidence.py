@@ -0,0 +1,104 @@
+'''
+Sparse AMP x habitat incidence and habitat overlaps
+
+AMPs and habitats (general_envo_name) are coded as integers and stored
+as a sparse binary matrix, built once from the table. Any grouping of the
+habitats (e.g. all mammalian guts together) is then obtained with a
+product by a habitat x group membership matrix, and the number of AMPs
+shared by every pair of groups with a single product of the incidence
+matrix by its transpose.
+'''
+
+
+def habitat_incidence(data, amp='amp', habitat='general_envo_name'):
+    '''
+    Binary AMP x habitat matrix of a table of AMPs and habitats
+
+    Rows without habitat are ignored
+
+    :input:
+    - data        dataframe with (at least) the AMP and habitat columns
+
+    :output:
+    - matrix      sparse (csr) matrix with 1 where an AMP occurs in a habitat
+    - amps        list of AMPs, one per row
+    - habitats    list of habitats, one per column
+    '''
+    import numpy as np
+    import pandas as pd
+    from scipy.sparse import csr_matrix
+    hcodes, habitats = pd.factorize(data[habitat])
+    keep = hcodes >= 0
+    acodes, amps = pd.factorize(data[amp][keep])
+    hcodes = hcodes[keep]
+    matrix = csr_matrix((np.ones(len(acodes), dtype=np.int32),
+                         (acodes, hcodes)),
+                        shape=(len(amps), len(habitats)))
+    # duplicated rows were summed up
+    matrix.data[:] = 1
+    return matrix, list(amps), list(habitats)
+
+
+def group_incidence(matrix, habitats, groups):
+    '''
+    Binary AMP x group matrix, where an AMP occurs in a group if it
+    occurs in any of its habitats
+
+    :input:
+    - matrix      AMP x habitat matrix from habitat_incidence
+    - habitats    list of habitats (columns of matrix)
+    - groups      dictionary of group name to list of habitats; a habitat
+                  may belong to several groups, and habitats absent from
+                  the data are ignored
+
+    :output:
+    - sparse (csr) AMP x group matrix, groups in the order of `groups`
+    '''
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    column = {h: i for i, h in enumerate(habitats)}
+    rows, cols = [], []
+    for j, members in enumerate(groups.values()):
+        for h in set(members):
+            if h in column:
+                rows.append(column[h])
+                cols.append(j)
+    membership = csr_matrix((np.ones(len(rows), dtype=np.int32),
+                             (rows, cols)),
+                            shape=(len(habitats), len(groups)))
+    grouped = (matrix @ membership).tocsr()
+    grouped.data[:] = 1
+    return grouped
+
+
+def cooccurrence(matrix, names):
+    '''
+    Number of AMPs shared by every pair of columns of a binary incidence
+    matrix (number of AMPs of each column in the diagonal)
+
+    :output:
+    - dataframe of integers with `names` as index and columns
+    '''
+    import pandas as pd
+    counts = (matrix.T @ matrix).toarray()
+    return pd.DataFrame(counts, index=names, columns=names)
+
+
+def habitat_overlaps(data, groups=None, amp='amp', habitat='general_envo_name'):
+    '''
+    Number of AMPs shared by every pair of habitat groups
+
+    :input:
+    - data        dataframe with the AMP and habitat columns
+    - groups      dictionary of group name to list of habitats, if None
+                  each habitat is its own group
+
+    :output:
+    - dataframe of shared AMPs between groups (index and columns in
+      the order of `groups`)
+    '''
+    matrix, _, habitats = habitat_incidence(data, amp, habitat)
+    if groups is None:
+        return cooccurrence(matrix, habitats)
+    grouped = group_incidence(matrix, habitats, groups)
+    return cooccurrence(grouped, list(groups))
@@ -5,15 +5,15 @@ def plot_mundi_map():
              displayed as blue dots
     '''
     import pandas as pd
+    from tables import load_table
     import geopandas as gpd
     import matplotlib.pyplot as plt
 
     print('Import data')
     input_file = 'data/gmsc_amp_genes_envohr_source.tsv.gz'
 
-    data = pd.read_table(input_file,
-                         sep='\t',
-                         header='infer')
+    data = load_table(input_file,
+                      columns=['latitude', 'longitude'])
 
     print('# filter coordinates and eliminate redundancy')
     df = data[['latitude', 'longitude']]
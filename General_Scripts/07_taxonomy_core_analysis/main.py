@@ -1,3 +1,5 @@
+import os
+
 from utils.amp_density_gut_traveling import density_travel
 #from utils.download_files import inputsgen
 from utils.taxonomy import taxon_analysis
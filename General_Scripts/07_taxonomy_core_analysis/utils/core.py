@@ -1,6 +1,7 @@
 import pandas as pd
 from collections import Counter
 import matplotlib.pyplot as plt
+from tables import load_table
 
 
 def classificationprop(x):
@@ -34,13 +35,12 @@ def linksource():
     columns to this analysis
     '''
     # linking to the source resource
-    refdata = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                            sep='\t',
-                            header='infer')
+    refdata = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                         columns=['amp', 'sample', 'specI'],
+                         filters=[('is_metagenomic', '==', False)],
+                         categories=False)
 
-    refdata = refdata[refdata.is_metagenomic == False]
     refdata = refdata[~(refdata.specI.isna())]
-    refdata = refdata[['amp','sample','specI']]
     refdata = refdata.sort_values(by=['amp', 'sample'])
     refdata = refdata.drop_duplicates()
 
@@ -1,102 +1,102 @@
-def mapsamples(fin):
-    '''
-    It maps the sample to its row index. It can be later used to
-    select rows in a large xz table. The sample column must be the
-    first and the file should be tab separated.
-    
-    :input:
-    - fin     input file opened as text using python-xz package
-    
-    :output:
-    - returns a dictionary mapping the rows and the samples
-    '''
-    index_sample = dict()
-    for idx, row in enumerate(fin):
-        if idx > 0:    # assume there is a header
-            sample = row.split('\t')[0]
-            if sample in index_sample:
-                index_sample[sample][1] = idx
-            else:
-                index_sample[sample] = [idx, idx]
-    return index_sample
-    
-
-def mapidx(fin, sample_map, ofile):
+CONTENTS = 'contents.tsv.xz'
+TAXONOMY = '/GMSC10/mmseqs2.lca_taxonomy.full.tsv.xz'
+
+CONTENTS_COLS = ['sample', 'contig', 'A', 'T', 'C', 'G']
+TAXONOMY_COLS = ['sample', 'contig', 'taxid',
+                 'level', 'name', 'retained',
+                 'assigned', 'agreement', 'support']
+
+
+def build_sample_index(fname, ofile):
     '''
-    Map the position of each row in the file in bytes
-    it is used to random access using python-xz
-    
+    Maps each sample to the range of bytes its rows occupy in a large
+    xz table, in a single pass. The sample column must be the first,
+    rows of a sample must be contiguous, and the file should be tab
+    separated with a header.
+
     :input:
-    - fin        input file opened as text using python-xz package
-    - sample_map input table with sample, start_row, end_row
+    - fname     xz compressed table
 
     :output:
-    - returns a dictionary mapping the rows in terms of bytes
-    positioning in the file
+    - ofile     table with columns sample, start, end (positions in
+                bytes in the uncompressed file, end excluded)
     '''
     import lzma
     import pandas as pd
-    data = pd.read_table(sample_map)
-    data['start'] = data['start'] - 1
-    data['end'] = data['end'] - 1
-    positions = set(data['start']).union(set(data['end']))
-    posix = dict()
-    idx, row = (0, 0)
-    fin.seek(0)
-    for l in fin:
-        idx += len(l)
-        if row in positions: posix[row] = idx
-        row += 1
-    data['start'] = [posix[x] for x in data['start']]
-    data['end'] = [posix[x] for x in data['end']]
-    data.to_csv(ofile, sep='\t', header=True, index=None)
+    samples, starts, ends = [], [], []
+    pos = 0
+    with lzma.open(fname, 'rb') as fin:
+        pos += len(fin.readline())    # header
+        current = None
+        for row in fin:
+            sample = row[:row.find(b'\t')]
+            if sample != current:
+                if current is not None:
+                    ends.append(pos)
+                samples.append(sample.decode())
+                starts.append(pos)
+                current = sample
+            pos += len(row)
+        if current is not None:
+            ends.append(pos)
+    df = pd.DataFrame({'sample': samples,
+                       'start': starts,
+                       'end': ends})
+    df.to_csv(ofile, sep='\t', header=True, index=None)
+    return df
+
+
+def load_sample_index(ofile):
+    '''
+    Load an index created by build_sample_index as a dataframe
+    indexed by sample
+    '''
+    import pandas as pd
+    return pd.read_table(ofile, keep_default_na=False).set_index('sample')
 
 
 def getdf(start: int, end: int, cols: list, fin):
     '''
-    Retrieve a dataframe from rows indexes and bytes
-    placement in the large file.
-    
+    Retrieve a dataframe from the bytes placement of
+    rows in the large file.
+
     :input:
-    - start, end      indexes of the first and last rows
-                      of interest as bytes in the xz file
+    - start, end      first byte and byte after the last row
+                      of interest in the xz file
     - cols            list of column names in the final
                       dataframe
-    - fin             input file opened as text using
+    - fin             input file opened as binary using
                       python-xz package
- 
+
     :output:
     - returns a dataframe in the original format as that
-    inputted in the xz file
+    inputted in the xz file (all columns as text)
     '''
+    import io
     import pandas as pd
-    if start == end:
-        fin.seek(start)
-        f = fin.readline()
-        f = f.strip().split('\t')
-        f = pd.DataFrame(f, index=cols).T
-    else:
-        fin.seek(start)
-        f = fin.readlines(end-start)
-        f = [i.strip().split('\t') for i in f]
-        f = pd.DataFrame(f, columns=cols)
-    return f
+    fin.seek(start)
+    return pd.read_csv(io.BytesIO(fin.read(end - start)),
+                       sep='\t',
+                       header=None,
+                       names=cols,
+                       dtype=str,
+                       keep_default_na=False)
 
 
 def process_chunk(record, taxrecord):
     '''
-    Receives two dataframes, the first containing the number of base pairs of 
+    Receives two dataframes, the first containing the number of base pairs of
     each type and another with the taxonomy of the contigs belonging to that
     sample.
-    
+
     :input:
     - record           dataframe containing the following columns:
                        sample, contig, A, C, T, G
-                       
+
     - taxrecord        dataframe containing the following columns:
                        sample, contig, taxid, level, name, retained,
                        assigned, agreement, support
-    
+
     :output:
     - dataframe of species and total base pairs assembled in a given sample
     columns: sample, taxid, level, name, total_bp
@@ -113,160 +113,140 @@ def process_chunk(record, taxrecord):
 
 def preprocess_contents():
     '''
-    Process the contents large table to create the map of samples
+    Process the contents large table to create the index of samples
 
     :input:
     =None
 
     :output:
-    2 relating row position to samples in contents and taxonomy tables
+    table relating byte positions to samples in the contents table
     '''
-    import xz  ## read with python-xz for speed
-    import pandas as pd
-
-
-    print('# working with contents:')
-    fin = xz.open('contents.tsv.xz', 'rt')
-    print('# getting samples mapped')
-    index_sample = mapsamples(fin)
-    df = pd.DataFrame.from_dict(index_sample,
-                                orient='index',
-                                columns=['start', 'end'])
-    df = df.reset_index()
-    df = df.rename({'index': 'sample'}, axis=1)
-    df.to_csv('sample_map_contents.tsv.xz',
-              sep='\t',
-              header=True,
-              index=None)
-    print('# getting index dict')
-    mapidx(fin,
-           'sample_map_contents.tsv.xz',
-           'row_indexes_contents.tsv.xz')
+    print('# indexing samples in contents')
+    build_sample_index(CONTENTS, 'sample_index_contents.tsv')
 
 
 def preprocess_taxonomy():
     '''
-    Process a large table to create the indices of samples
+    Process a large table to create the index of samples
     in taxonomy
 
     :input:
     =None
 
     :output:
-    2 relating bytes position to samples in contents and taxonomy tables
+    table relating byte positions to samples in the taxonomy table
     '''
-    import xz
-    import pandas as pd
+    print('# indexing samples in taxonomies')
+    build_sample_index(TAXONOMY, 'sample_index_taxonomy.tsv')
 
-    print('# working with taxonomies:')
-    fin = xz.open('/GMSC10/mmseqs2.lca_taxonomy.full.tsv.xz', 'rt')
-    print('# getting samples mapped')
-    index_sample = mapsamples(fin)
-    df = pd.DataFrame.from_dict(index_sample,
-                                orient='index',
-                                columns=['start', 'end'])
-    df = df.reset_index()
-    df = df.rename({'index': 'sample'}, axis=1)
-    df.to_csv('sample_map_taxonomy.tsv.xz',
-              sep='\t',
-              header=True,
-              index=None)
-    print('# getting index dict')
-    mapidx(fin,
-           'sample_map_taxonomy.tsv.xz',
-           'row_indexes_taxonomy.tsv.xz')
-
-
-def load_all():
+
+def merge_part(args):
     '''
-    Load indices of samples and prepare files to 
-    process by samples
+    Merge base-pairs and taxonomy for a list of samples, using its
+    own file handles, writing the results (without header) to an xz
+    compressed shard
 
     :input:
-    = None
-
-    :output:
-    - posix_sample     dictionary containing row index
-                       and byte position in contents file
-    - posix_tax        dictionary containing row index and
-                       byte position in taxonomy file
-    - idx_sample       dictionary containing sample, starting and
-                       ending row in contents file
-    - idx_tax          dictionary containing sample, starting and
-                       ending row in taxonomy file
-    - fcontent         xz opened contents file
-    - ftax             xz opened taxonomy file
+    - args        tuple (samples, psample, ptax, shard), where psample and
+                  ptax are lists with the (start, end) of each sample in
+                  the contents and taxonomy files
     '''
     import xz
-    import pandas as pd
-
-
-    print('Load files')
-    posix_sample = pd.read_table('row_indexes_contents.tsv.xz')
-    posix_sample = posix_sample.set_index('sample')
-    posix_tax = pd.read_table('row_indexes_taxonomy.tsv.xz')
-    posix_tax = posix_tax.set_index('sample')
-    fcontent = xz.open('contents.tsv.xz', 'rt')
-    ftax = xz.open('/GMSC10/mmseqs2.lca_taxonomy.full.tsv.xz', 'rt')
-
-    return [fcontent, ftax,
-            posix_sample, posix_tax]
-
-
-def work_merge(contents, tax, psample, ptax, ofile: str):
+    samples, psample, ptax, shard = args
+    with xz.open(CONTENTS, 'rb') as contents, \
+            xz.open(TAXONOMY, 'rb') as tax:
+        with open(shard, 'wb') as out:
+            for s, (cstart, cend), (tstart, tend) in zip(samples, psample, ptax):
+                sdf1 = getdf(cstart, cend, CONTENTS_COLS, contents)
+                sdf2 = getdf(tstart, tend, TAXONOMY_COLS, tax)
+                sdf1 = sdf1[sdf1['sample'] == s]
+                sdf2 = sdf2[(sdf2['sample'] == s) &
+                            sdf2.level.isin(['species', 'genus'])]
+                fdf = process_chunk(sdf1, sdf2)
+                fdf.reset_index().to_csv(out,
+                                         mode='ab',
+                                         sep='\t',
+                                         header=None,
+                                         index=None,
+                                         compression='xz')
+    return shard
+
+
+def work_merge(psample, ptax, ofile: str, workers=1):
     '''
     Works by sample merging base-pairs per sample and contig and
     summing up if same sample and genus/species.
-    
+
+    Samples are split in contiguous parts processed by a pool of
+    `workers` processes, each part being written to its own shard.
+    Shards are then concatenated (as xz streams) in the original
+    order of the samples.
+
     :input:
-    - contents    opened xz contents file
-    - tax         opened xz taxonomy file
-    - psample     dataframe with row and bytes position of contents file
-    - ptax        dataframe with row and bytes position of taxonomy file
-    
+    - psample     dataframe with bytes positions of samples in contents file
+    - ptax        dataframe with bytes positions of samples in taxonomy file
+    - workers     number of processes
+
     :output:
-    - ofile       output file containing the base-pairs by sample and genus/species    
+    - ofile       output file containing the base-pairs by sample and genus/species
     '''
+    import os
+    import shutil
     import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
     print('Start preparing and merging')
-    i = pd.DataFrame(columns=['sample', 'taxid', 'level', 'name', 'bp'])
-    i.to_csv(ofile,
-             mode='a',
-             sep='\t',
-             header=True,
-             index=None)
-    for s in psample.index:
-        print(f'Process sample {s}')
-        sdf1 = getdf(psample.loc[s, 'start'],
-                     psample.loc[s, 'end'],
-                     ['sample', 'contig', 'A', 'T', 'C', 'G'],
-                     contents)
-        sdf2 = getdf(ptax.loc[s, 'start'],
-                     ptax.loc[s, 'end'],
-                     ['sample', 'contig', 'taxid',
-                      'level', 'name', 'retained',
-                      'assigned', 'agreement', 'support'],
-                     tax)
-        sdf2 = sdf2[sdf2.level.isin(['species', 'genus'])]
-        fdf = process_chunk(sdf1, sdf2)
-        fdf.reset_index().to_csv(ofile,
-                                 mode='a',
-                                 sep='\t',
-                                 header=None,
-                                 index=None)
-
-
-def main():
-#    preprocess_contents()
-#    preprocess_taxonomy()
-    contents, tax, psample, ptax = load_all()
-    work_merge(contents, 
-               tax, 
-               psample, 
-               ptax, 
-               './processed_contents_bp.tsv.xz')
+    samples = [s for s in psample.index if s in ptax.index]
+    missing = len(psample) - len(samples)
+    if missing:
+        print(f'{missing} samples without taxonomy were skipped')
+    nparts = max(1, min(len(samples), workers * 4))
+    bounds = [len(samples) * k // nparts for k in range(nparts + 1)]
+    tasks = []
+    for k in range(nparts):
+        part = samples[bounds[k]:bounds[k + 1]]
+        tasks.append((part,
+                      psample.loc[part, ['start', 'end']].values.tolist(),
+                      ptax.loc[part, ['start', 'end']].values.tolist(),
+                      f'{ofile}.part{k:05d}'))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = list(executor.map(merge_part, tasks))
+    else:
+        shards = [merge_part(t) for t in tasks]
+
+    header = pd.DataFrame(columns=['sample', 'taxid', 'level', 'name', 'bp'])
+    header.to_csv(ofile,
+                  sep='\t',
+                  header=True,
+                  index=None,
+                  compression='xz')
+    with open(ofile, 'ab') as out:
+        for shard in shards:
+            with open(shard, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(shard)
+
+
+def main(workers=1):
+    import os
+    if not os.path.exists('sample_index_contents.tsv'):
+        preprocess_contents()
+    if not os.path.exists('sample_index_taxonomy.tsv'):
+        preprocess_taxonomy()
+    psample = load_sample_index('sample_index_contents.tsv')
+    ptax = load_sample_index('sample_index_taxonomy.tsv')
+    work_merge(psample,
+               ptax,
+               './processed_contents_bp.tsv.xz',
+               workers)
 
 
 if __name__ == '__main__':
-    main()
-
+    import argparse
+    parser = argparse.ArgumentParser(description='Base pairs per taxon and sample')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=1,
+                        help='number of processes merging samples')
+    args = parser.parse_args()
+    main(args.workers)
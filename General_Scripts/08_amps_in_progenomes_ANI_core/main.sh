@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# modules shared by the analyses are in General_Scripts/shared
+export PYTHONPATH="$(cd "$(dirname "$0")/../shared" && pwd)${PYTHONPATH:+:$PYTHONPATH}"
+
 # to generate reference AMPs for progenomes 
 python3 utils/generating_AMP_progenomes.py
 
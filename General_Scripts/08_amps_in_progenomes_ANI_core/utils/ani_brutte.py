@@ -5,21 +5,11 @@ import pickle as pkl
 
 from glob import glob
 from subprocess import run
-from nuc_download import batchdownload
-from nuc_download import get_assemblies
+from genome_source import settings, fetch_many, link_files
 from res_ani_test import checkres
+from tables import load_table
 
-def checkfile(f):
-    '''
-    check the integrity of the compressed file f
-    '''
-    import subprocess
-    s = subprocess.run(["gzip",
-                        "-t",
-                        f],
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE)
-    return s.returncode
+source, mirror, cache_dir, workers = settings()
 
 print('Load Progenomes2 clusters')
 
@@ -36,8 +26,10 @@ clusters = clusters[clusters.L >= 10].sort_values(by='L').drop('L', axis=1)
 
 print('Load AMPSphere AMPs')
 
-amps = pd.read_table('data/complete_gmsc_pgenomes_metag.tsv.gz', sep='\t', header='infer')
-amps = amps[amps.is_metagenomic == False]
+amps = load_table('data/complete_gmsc_pgenomes_metag.tsv.gz',
+                  columns=['amp', 'sample'],
+                  filters=[('is_metagenomic', '==', False)],
+                  categories=False)
 amps['sample'] = amps['sample'].apply(lambda x: '.'.join(x.split(".")[1:]))
 amps = amps[['amp', 'sample']].drop_duplicates()
 
@@ -74,16 +66,9 @@ for _, c, i in clusters.itertuples():
     if c in alreadynot:
         print(f'Skipping {c}, passing to next')
     else:
-        batchdownload(i)
-        for f in glob('*.fna.gz'):
-            if checkfile(f):
-                x = f.split('.')[0]
-                links = get_assemblies(x,
-                               download=True)
-                if checkfile(f):
-                    print('.')
-                else:
-                    os.remove(f)
+        # genomes are kept in the cache, only links are removed later
+        genomes = fetch_many(i, 'fna', source, cache_dir, mirror, workers)
+        link_files(genomes, 'fna')
 
         N = len(list(glob('*.fna.gz')))  
         
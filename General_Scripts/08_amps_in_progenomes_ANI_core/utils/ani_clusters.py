@@ -0,0 +1,121 @@
+'''
+Clustering of genomes (clones, strains) from fastANI tables
+
+Genomes are linked when their ANI reaches a cutoff, and clusters are the
+connected components of that graph. All cutoffs are obtained in a single
+pass over the comparisons sorted by decreasing ANI: components are
+merged with a union-find structure, and labels are recorded each time
+the ANI drops below the next cutoff.
+
+Clusters are numbered in the order of their (alphabetically) first
+genome. The representative of each cluster is the genome with most
+comparisons over the cutoff (ties broken by the genome name), so results
+do not depend on random sampling.
+'''
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    # path compression
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def _union(parent, size, i, j):
+    i, j = _find(parent, i), _find(parent, j)
+    if i == j:
+        return
+    if size[i] < size[j]:
+        i, j = j, i
+    parent[j] = i
+    size[i] += size[j]
+
+
+def _snapshot(parent, degree, seen):
+    '''
+    Label and representative of each genome seen so far
+
+    Returns two dictionaries of genome code to label and to the code of
+    its representative
+    '''
+    labels, best = dict(), dict()
+    for i in range(len(parent)):
+        if not seen[i]:
+            continue
+        root = _find(parent, i)
+        if root not in best:
+            labels[root] = len(labels)
+            best[root] = i
+        elif degree[i] > degree[best[root]]:
+            best[root] = i
+    label = {i: labels[_find(parent, i)] for i in range(len(parent)) if seen[i]}
+    representative = {i: best[_find(parent, i)] for i in label}
+    return label, representative
+
+
+def ani_clusters(infile, cutoffs, strict=False):
+    '''
+    Cluster the genomes of a fastANI table at several ANI cutoffs
+
+    Inputs: infile - fastANI output (query, reference, ANI, matching
+                     fragments, total fragments), genome names ending
+                     in .fna.gz
+            cutoffs - dict of level name (e.g. 'clone', 'strain') to the
+                      minimum ANI linking two genomes
+            strict - link genomes only if the ANI is above the cutoff
+    Returns: dataframe indexed by genome with, for each level, the
+             cluster label (column `<level>`) and its representative
+             (column `<level>_representative`); genomes without any
+             comparison at a level have missing values
+    '''
+    import numpy as np
+    import pandas as pd
+    data = pd.read_table(infile,
+                         header=None,
+                         usecols=[0, 1, 2],
+                         names=['s1', 's2', 'ani'])
+    data.loc[data.s1 == data.s2, 'ani'] = 100
+    s1 = data.s1.str.replace('.fna.gz', '', regex=False)
+    s2 = data.s2.str.replace('.fna.gz', '', regex=False)
+    codes, genomes = pd.factorize(pd.concat([s1, s2]), sort=True)
+    n = len(data)
+    q, r = codes[:n].tolist(), codes[n:].tolist()
+    ani = data.ani.values
+    order = np.argsort(-ani, kind='stable').tolist()
+    ani = ani.tolist()
+
+    parent = list(range(len(genomes)))
+    size = [1] * len(genomes)
+    degree = [0] * len(genomes)
+    seen = [False] * len(genomes)
+
+    res = pd.DataFrame(index=pd.Index(genomes, name=None))
+    pos = 0
+    for name, cutoff in sorted(cutoffs.items(), key=lambda x: -x[1]):
+        while pos < n:
+            e = order[pos]
+            value = ani[e]
+            # also stops at missing values, sorted to the end
+            if not (value > cutoff or (value == cutoff and not strict)):
+                break
+            i, j = q[e], r[e]
+            seen[i] = seen[j] = True
+            if i != j:
+                degree[i] += 1
+                degree[j] += 1
+                _union(parent, size, i, j)
+            pos += 1
+        label, representative = _snapshot(parent, degree, seen)
+        res[name] = pd.Series({genomes[i]: v for i, v in label.items()},
+                              dtype='float64')
+        res[f'{name}_representative'] = pd.Series(
+                {genomes[i]: genomes[v] for i, v in representative.items()},
+                dtype=object)
+    res = res.dropna(how='all')
+    for name in cutoffs:
+        if res[name].notna().all():
+            res[name] = res[name].astype(int)
+    return res
@@ -0,0 +1,257 @@
+'''
+Genomes and proteomes of ProGenomes samples, through a local cache
+
+Files are fetched from a source and stored in a content-addressed cache,
+so that each assembly is downloaded once and reused by every later run
+(and by both the ANI and the proteome analyses):
+
+    genome_cache/objects/ab/ab12...ef.gz    files, named by their SHA-256
+    genome_cache/refs/fna/<sample>          SHA-256 of the genome of a sample
+    genome_cache/refs/faa/<sample>          SHA-256 of its proteome
+    genome_cache/refs/ftp/<sample>          NCBI FTP folder of its assembly
+
+Sources:
+
+    ncbi     assemblies found with Entrez and downloaded from the NCBI FTP
+    mirror   a local folder with <sample>.fna.gz and <sample>.faa.gz files
+             (works offline)
+
+Files are checked while they are added to the cache, by decompressing
+them completely in the process, and several samples are fetched at once
+by a bounded pool of threads. Entrez queries of all threads share a rate
+limit (3 per second, or 10 with an NCBI API key), and samples without a
+RefSeq assembly are only remembered for NEGATIVE_TTL seconds.
+
+The scripts read their settings from the environment:
+
+    GENOME_SOURCE (ncbi), GENOME_MIRROR, GENOME_CACHE (genome_cache),
+    FETCH_WORKERS (4), NCBI_API_KEY
+'''
+
+import os
+import threading
+
+# samples without an assembly are queried again after a week
+NEGATIVE_TTL = 7 * 24 * 3600
+
+SUFFIXES = {'fna': '_genomic.fna.gz',
+            'faa': '_protein.faa.gz'}
+
+
+def settings():
+    '''Source, mirror folder, cache folder and number of workers'''
+    return (os.environ.get('GENOME_SOURCE', 'ncbi'),
+            os.environ.get('GENOME_MIRROR'),
+            os.environ.get('GENOME_CACHE', 'genome_cache'),
+            int(os.environ.get('FETCH_WORKERS', 4)))
+
+
+def check_gzip(fname):
+    '''
+    Decompress `fname` completely and return its SHA-256, or None if it
+    is not a valid gzip file
+    '''
+    import gzip
+    import zlib
+    import hashlib
+    h = hashlib.sha256()
+    try:
+        with open(fname, 'rb') as raw:
+            with gzip.GzipFile(fileobj=raw) as f:
+                while f.read(1 << 20):
+                    pass
+            raw.seek(0)
+            for block in iter(lambda: raw.read(1 << 20), b''):
+                h.update(block)
+    except (OSError, EOFError, zlib.error):
+        return None
+    return h.hexdigest()
+
+
+def _ref(cache_dir, kind, sample):
+    return f'{cache_dir}/refs/{kind}/{sample}'
+
+
+def _object(cache_dir, digest):
+    return f'{cache_dir}/objects/{digest[:2]}/{digest}.gz'
+
+
+def _write_text(fname, text):
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    tmp = f'{fname}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, fname)
+
+
+def cached(sample, kind, cache_dir='genome_cache'):
+    '''Path of the cached file of a sample, or None'''
+    ref = _ref(cache_dir, kind, sample)
+    if not os.path.exists(ref):
+        return None
+    with open(ref) as f:
+        path = _object(cache_dir, f.read().strip())
+    return path if os.path.exists(path) else None
+
+
+_entrez_lock = threading.Lock()
+_entrez_next = [0.0]
+
+
+def _entrez_wait():
+    '''
+    Wait until an Entrez query can be sent without exceeding the rate
+    allowed by NCBI (shared by all threads)
+    '''
+    import time
+    rate = 10 if os.environ.get('NCBI_API_KEY') else 3
+    with _entrez_lock:
+        now = time.monotonic()
+        if _entrez_next[0] > now:
+            time.sleep(_entrez_next[0] - now)
+            now = _entrez_next[0]
+        _entrez_next[0] = now + 1 / rate
+
+
+def _ncbi_folder(sample, cache_dir):
+    '''
+    FTP folder of the (last) RefSeq assembly found for a sample, cached
+    so that genomes and proteomes share a single Entrez query
+
+    An empty folder (no RefSeq assembly) is cached for NEGATIVE_TTL
+    seconds; failed queries raise and are not cached
+    '''
+    import time
+    from nuc_download import get_assembly_summary
+    from Bio import Entrez
+    ref = _ref(cache_dir, 'ftp', sample)
+    if os.path.exists(ref):
+        with open(ref) as f:
+            url = f.read().strip()
+        if url != '' or time.time() - os.path.getmtime(ref) < NEGATIVE_TTL:
+            return url
+    Entrez.email = "celio.diasjunior@gmail.com"
+    if os.environ.get('NCBI_API_KEY'):
+        Entrez.api_key = os.environ['NCBI_API_KEY']
+    _entrez_wait()
+    handle = Entrez.esearch(db="assembly", term=sample, retmax='200')
+    record = Entrez.read(handle)
+    url = ''
+    for id in record['IdList']:
+        _entrez_wait()
+        summary = get_assembly_summary(id)
+        link = summary['DocumentSummarySet']['DocumentSummary'][0]['FtpPath_RefSeq']
+        if link != '':
+            url = link
+    _write_text(ref, url)
+    return url
+
+
+def _fetch_ncbi(sample, kind, dest, cache_dir, mirror):
+    import urllib.request
+    url = _ncbi_folder(sample, cache_dir)
+    if url == '':
+        return False
+    label = os.path.basename(url)
+    link = f'{url}/{label}{SUFFIXES[kind]}'
+    # the NCBI FTP folders are also served over https
+    link = link.replace('ftp://', 'https://', 1)
+    urllib.request.urlretrieve(link, dest)
+    return True
+
+
+def _fetch_mirror(sample, kind, dest, cache_dir, mirror):
+    import shutil
+    src = f'{mirror}/{sample}.{kind}.gz'
+    if not os.path.exists(src):
+        return False
+    shutil.copyfile(src, dest)
+    return True
+
+
+SOURCES = {'ncbi': _fetch_ncbi,
+           'mirror': _fetch_mirror}
+
+
+def fetch(sample, kind, source='ncbi', cache_dir='genome_cache',
+          mirror=None, retries=2):
+    '''
+    Path of the cached genome (kind='fna') or proteome (kind='faa') of a
+    sample, fetching it from `source` if needed
+
+    Returns None if it could not be fetched or is corrupted
+    '''
+    import time
+    import tempfile
+    path = cached(sample, kind, cache_dir)
+    if path is not None:
+        return path
+    fetcher = SOURCES[source]
+    tmpdir = f'{cache_dir}/tmp'
+    os.makedirs(tmpdir, exist_ok=True)
+    for attempt in range(retries):
+        if attempt:
+            time.sleep(2 ** attempt)
+        fd, tmp = tempfile.mkstemp(dir=tmpdir, suffix='.gz')
+        os.close(fd)
+        try:
+            if not fetcher(sample, kind, tmp, cache_dir, mirror):
+                return None
+            digest = check_gzip(tmp)
+            if digest is None:
+                continue
+            path = _object(cache_dir, digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            _write_text(_ref(cache_dir, kind, sample), digest)
+            return path
+        except Exception as e:
+            print(f'Could not fetch {kind} of {sample}: {e}')
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return None
+
+
+def fetch_many(samples, kind, source='ncbi', cache_dir='genome_cache',
+               mirror=None, workers=4):
+    '''
+    Fetch several samples at once, with at most `workers` downloads in
+    parallel
+
+    Returns a dictionary of sample to cached file, for the samples that
+    could be fetched. The other samples are reported, and listed in
+    <cache_dir>/failed_<kind>.txt
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    paths = {s: cached(s, kind, cache_dir) for s in samples}
+    todo = [s for s, p in paths.items() if p is None]
+    print(f'{len(paths) - len(todo)} {kind} files in cache, fetching {len(todo)}')
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        fetched = executor.map(
+            lambda s: fetch(s, kind, source, cache_dir, mirror),
+            todo)
+        paths.update(zip(todo, fetched))
+    failed = [s for s, p in paths.items() if p is None]
+    if failed:
+        print(f'Could not fetch {len(failed)} {kind} files: {", ".join(failed)}')
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f'{cache_dir}/failed_{kind}.txt', 'a') as out:
+            for s in failed:
+                out.write(f'{s}\n')
+    return {s: p for s, p in paths.items() if p is not None}
+
+
+def link_files(paths, kind, folder='.'):
+    '''
+    Make the cached files available as <folder>/<sample>.<kind>.gz
+    (symbolic links, removing them does not affect the cache)
+    '''
+    links = []
+    for sample, path in paths.items():
+        link = f'{folder}/{sample}.{kind}.gz'
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.abspath(path), link)
+        links.append(link)
+    return links
@@ -1,79 +1,91 @@
-def get_clusters(data, filter):
-    import networkx as nx
-    nodes = []
-    for _, s1, s2, ani, _, _ in data.loc[filter].itertuples():
-        nodes.append((s1, s2))
-    G = nx.Graph()
-    G.add_edges_from(nodes)
-    return list(nx.connected_components(G))
-
-
-def format_labels(labels):
-    newdict = dict()
-    for idx, i in enumerate(labels):
-        for j in i: newdict[j] = idx
-    return newdict
+import os
 
 
 def get_clones_strains(infile, cutoffstrain, cutoffclone):
-    import pandas as pd
-    data = pd.read_table(infile,
-                         header=None,
-                         names=['s1', 's2', 'ani', 'match', 'total'])
-    data.loc[data.s1 == data.s2, 'ani'] = 100
-    data.s1 = data.s1.str.replace('.fna.gz', '', regex=False)
-    data.s2 = data.s2.str.replace('.fna.gz', '', regex=False)
-    c = get_clusters(data,
-                     (data.ani >= cutoffclone))
-    st = get_clusters(data,
-                      (data.ani >= cutoffstrain))
-    c = pd.DataFrame.from_dict(format_labels(c), orient='index')
-    c = c.rename({0: 'clone'}, axis=1)
-    st = pd.DataFrame.from_dict(format_labels(st), orient='index')
-    st = st.rename({0: 'strain'}, axis=1)
-    return pd.concat([c, st], axis=1)
+    '''
+    Clone and strain labels (with their representatives) of the genomes
+    in a fastANI table
+    '''
+    from ani_clusters import ani_clusters
+    return ani_clusters(infile, {'clone': cutoffclone,
+                                 'strain': cutoffstrain})
 
 
 def load_ampsphere():
+    '''
+    Load the AMPs of each genome (non-metagenomic samples) as a sparse
+    genome x AMP incidence matrix
+
+    Returns (matrix, genomes), where genomes maps each genome to its row
+    '''
+    import numpy as np
     import pandas as pd
-    df = pd.read_table('data/complete_gmsc_pgenomes_metag.tsv.gz')
-    df = df[df.is_metagenomic==False]
+    from scipy.sparse import csr_matrix
+    from tables import load_table
+    df = load_table('data/complete_gmsc_pgenomes_metag.tsv.gz',
+                    columns=['amp', 'sample'],
+                    filters=[('is_metagenomic', '==', False)],
+                    categories=False)
     df['sample'] = df['sample'].apply(lambda x: '.'.join(x.split('.')[1:]))
-    df = df.groupby('sample').apply(lambda x: set(x.amp))
-    return df
-
-
-def head_row(w):
-   w = w.reset_index()
-   w = w['index'].sample(1)
-   return w
+    df = df[['sample', 'amp']].drop_duplicates()
+    rows, genomes = pd.factorize(df['sample'])
+    cols, amps = pd.factorize(df['amp'])
+    matrix = csr_matrix((np.ones(len(df), dtype=np.int32), (rows, cols)),
+                        shape=(len(genomes), len(amps)))
+    return matrix, {g: i for i, g in enumerate(genomes)}
+
+
+def _incidence_rows(amps, genomes):
+    # rows of the incidence matrix for a list of genomes (genomes without
+    # AMPs get an empty row)
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    matrix, index = amps
+    rows = np.array([index.get(g, -1) for g in genomes], dtype=np.int64)
+    keep = np.flatnonzero(rows >= 0)
+    select = csr_matrix((np.ones(len(keep), dtype=matrix.dtype),
+                         (keep, rows[keep])),
+                        shape=(len(genomes), matrix.shape[0]))
+    return select @ matrix
+
+
+def pair_overlaps(amps, genomes):
+    '''
+    Shared and total number of AMPs for all pairs of genomes
+
+    Inputs: amps - (matrix, genomes) from load_ampsphere
+            genomes - list of genome names
+    Returns: (shared, total) as square arrays indexed as `genomes`
+    '''
+    import numpy as np
+    m = _incidence_rows(amps, genomes)
+    shared = (m @ m.T).toarray()
+    sizes = np.asarray(m.sum(axis=1)).ravel()
+    total = sizes[:, None] + sizes[None, :] - shared
+    return shared, total
 
 
 def testamps(amps, s1, s2):
-    if (s1 in amps.index): as1 = amps.loc[s1]
-    else: as1 = set()    
-    if (s2 in amps.index): as2 = amps.loc[s2] 
-    else: as2 = set()
-    overlap = as1.intersection(as2)
-    total = as1.union(as2)
-    no, ntotal = len(overlap), len(total)
+    shared, total = pair_overlaps(amps, [s1, s2])
+    no, ntotal = int(shared[0, 1]), int(total[0, 1])
     if ntotal == 0: npct=0
     else: npct = no*100/ntotal
     return (no, ntotal, npct)
 
 
 def test_overlap(infile, amps, cutoffstrain, cutoffclone):
+    import numpy as np
     import pandas as pd
     from itertools import combinations
     name = infile.split('/')[-1]
     name = name.replace('_ANI.tsv', '')
     df = get_clones_strains(infile, cutoffstrain, cutoffclone)
-    df.to_csv(f'amp_results/{name}_strain_clones.tsv',
-              sep='\t',
-              header=True,
-              index=True)    
-    strain_sample = df.groupby('clone').apply(lambda w: head_row(w))
-    strain_sample = df.loc[strain_sample[0].tolist(),
+    df[['clone', 'strain']].to_csv(f'amp_results/{name}_strain_clones.tsv',
+                                   sep='\t',
+                                   header=True,
+                                   index=True)    
+    # one genome per clone
+    strain_sample = df.loc[df.clone_representative.dropna().unique(),
                            'strain']
     strain_sample = strain_sample.reset_index()
     strain_sample = strain_sample.rename({'index': 'genome'}, axis=1)
@@ -81,25 +93,39 @@ def test_overlap(infile, amps, cutoffstrain, cutoffclone):
     strain_sample = strain_sample.apply(lambda x: x.genome.tolist())
     strain_sample = strain_sample.reset_index().rename({0: 'genomes'}, axis=1)
     strain_sample['L'] = strain_sample.genomes.apply(lambda x: len(x))
-    overl=[]
-    if len(strain_sample[strain_sample.L > 1]) > 0:
-        print('Computing within-strain overlaps')
-        for st in strain_sample.loc[strain_sample.L > 1, 'strain']:
-            genomes = strain_sample.loc[strain_sample.strain == st, 'genomes'].tolist()[0]
-            for g1, g2 in combinations(genomes, 2):
-                no, ntotal, npct = testamps(amps, g1, g2)    
-                overl.append((name, g1, g2, st, st, no, ntotal, npct))      
-    print('Computing cross-strain overlaps')
-    for st1, st2 in combinations(strain_sample.strain, 2):
-        genomes1 = strain_sample.loc[strain_sample.strain == st1, 'genomes'].tolist()[0]
-        genomes2 = strain_sample.loc[strain_sample.strain == st2, 'genomes'].tolist()[0]
-        for g1 in genomes1:
-            for g2 in genomes2:
-                no, ntotal, npct = testamps(amps, g1, g2)    
-                overl.append((name, g1, g2, st1, st2, no, ntotal, npct))
-    overl = pd.DataFrame(overl, columns=['species', 'genome1', 'genome2',
-                                         'strain1', 'strain2', 'shared_amps',
-                                         'total_nr_amps', 'percent_shared'])
+    genomes = [g for gs in strain_sample.genomes for g in gs]
+    strain_of = [st for st, gs in zip(strain_sample.strain, strain_sample.genomes)
+                 for _ in gs]
+    print('Computing genome x genome overlaps')
+    shared, total = pair_overlaps(amps, genomes)
+    # pairs are listed in the same order as before: first within
+    # strains, then across each pair of strains
+    offsets = np.cumsum([0] + strain_sample.L.tolist())
+    blocks = list(zip(offsets[:-1], offsets[1:]))
+    ix1, ix2 = [], []
+    for start, end in blocks:
+        if end - start > 1:
+            i, j = np.triu_indices(end - start, k=1)
+            ix1.append(i + start)
+            ix2.append(j + start)
+    for (s1, e1), (s2, e2) in combinations(blocks, 2):
+        ix1.append(np.repeat(np.arange(s1, e1), e2 - s2))
+        ix2.append(np.tile(np.arange(s2, e2), e1 - s1))
+    ix1 = np.concatenate(ix1) if ix1 else np.array([], dtype=int)
+    ix2 = np.concatenate(ix2) if ix2 else np.array([], dtype=int)
+    no, ntotal = shared[ix1, ix2], total[ix1, ix2]
+    npct = np.divide(no * 100, ntotal,
+                     out=np.zeros(len(no)),
+                     where=(ntotal != 0))
+    genomes, strain_of = np.array(genomes, dtype=object), np.array(strain_of)
+    overl = pd.DataFrame({'species': name,
+                          'genome1': genomes[ix1],
+                          'genome2': genomes[ix2],
+                          'strain1': strain_of[ix1],
+                          'strain2': strain_of[ix2],
+                          'shared_amps': no,
+                          'total_nr_amps': ntotal,
+                          'percent_shared': npct})
     overl.to_csv(f'amp_results/{name}_amp_overlaps.tsv',
                  sep='\t',
                  header=True,
@@ -0,0 +1,101 @@
+'''
+Prevalence of proteins across the genomes of a species cluster
+
+Proteomes are read one at a time, as a stream. Each protein sequence is
+hashed to a 64-bit digest (BLAKE2), which is associated with a bitset of
+the genomes containing it (bit g is set for the g-th proteome). The
+number of genomes of every protein is then summarized as a histogram,
+whose reversed cumulative sum gives the number of proteins present in at
+least a given number of genomes, i.e. the full prevalence curve.
+
+With ~10^7 distinct proteins the chance of two sequences sharing a
+digest is below 10^-5.
+'''
+
+import numpy as np
+
+
+def read_sequences(infile):
+    '''Iterate over the sequences of a (gzipped) FASTA file'''
+    import gzip
+    opener = gzip.open if infile.endswith('.gz') else open
+    chunks = []
+    with opener(infile, 'rt') as f:
+        for line in f:
+            if line.startswith('>'):
+                if chunks:
+                    yield ''.join(chunks)
+                chunks = []
+            else:
+                chunks.append(line.strip())
+    if chunks:
+        yield ''.join(chunks)
+
+
+def digest(seq):
+    '''64-bit digest of a sequence'''
+    from hashlib import blake2b
+    return int.from_bytes(blake2b(seq.encode('ascii'), digest_size=8).digest(),
+                          'little')
+
+
+def genome_bitsets(infiles, sequences=None):
+    '''
+    Digest -> bitset of genomes, for the proteins of `infiles` (one
+    proteome per file, genome g being infiles[g])
+
+    If a dictionary is given as `sequences`, it is filled with the
+    sequence of each digest
+    '''
+    bitsets = dict()
+    for g, infile in enumerate(infiles):
+        bit = 1 << g
+        for seq in read_sequences(infile):
+            d = digest(seq)
+            prev = bitsets.get(d)
+            if prev is None:
+                bitsets[d] = bit
+                if sequences is not None:
+                    sequences[d] = seq
+            else:
+                bitsets[d] = prev | bit
+    return bitsets
+
+
+def members(bitset):
+    '''Indices of the genomes in a bitset'''
+    out = []
+    g = 0
+    while bitset:
+        if bitset & 1:
+            out.append(g)
+        bitset >>= 1
+        g += 1
+    return out
+
+
+def prevalence_histogram(bitsets, n_genomes):
+    '''Number of proteins found in exactly 0, 1, ..., n_genomes genomes'''
+    counts = np.fromiter((bin(b).count('1') for b in bitsets.values()),
+                         dtype=np.int64,
+                         count=len(bitsets))
+    return np.bincount(counts, minlength=n_genomes + 1)
+
+
+def prevalence_curve(hist, n_genomes, cutoffs=range(0, 101)):
+    '''
+    For each prevalence cutoff (% of genomes), the number and percent of
+    distinct proteins present in at least that percent of the genomes
+
+    Returns a list of (cutoff, number of proteins, percent of proteins)
+    '''
+    total = int(hist.sum())
+    # proteins in at least c genomes
+    atleast = np.cumsum(hist[::-1])[::-1]
+    percent = np.arange(n_genomes + 1) * 100 / n_genomes
+    res = []
+    for cutoff in cutoffs:
+        above = np.flatnonzero(percent >= cutoff)
+        k = int(atleast[above[0]]) if len(above) else 0
+        res.append((cutoff, k, k*100/total))
+    return res
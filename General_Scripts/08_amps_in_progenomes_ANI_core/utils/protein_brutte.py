@@ -5,22 +5,11 @@ import pickle as pkl
 
 from glob import glob
 from workfams import families
-from openfasta import openfasta
-from prot_download import batchdownload
-from prot_download import get_assemblies
+from prevalence import genome_bitsets, members
+from prevalence import prevalence_histogram, prevalence_curve
+from genome_source import settings, fetch_many, link_files
 
-
-def checkfile(f):
-    '''
-    check the integrity of the compressed file f
-    '''
-    import subprocess
-    s = subprocess.run(["gzip",
-                        "-t",
-                        f],
-                       stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE)
-    return s.returncode
+source, mirror, cache_dir, workers = settings()
          
          
 print('Load Progenomes2 clusters')
@@ -58,38 +47,18 @@ with open('Notes.txt', 'a') as output:
             print(f'Already analyzed {c}, passing to next')
         else:
             print(f'Working with cluster {c} -------------')
-            batchdownload(i)
-            for f in glob('*.gz'):
-                if checkfile(f):
-                    x = f.split('.')[0]
-                    links = get_assemblies(x,
-                                   download=True)
-                    if checkfile(f):
-                        print('.')
-                    else:
-                        os.remove(f)
+            # proteomes are kept in the cache, only links are removed later
+            proteomes = fetch_many(i, 'faa', source, cache_dir, mirror, workers)
+            link_files(proteomes, 'faa')
             N = len(list(glob('*.gz'))) 
             if N >= 10:
-                seqs = dict()
-                for f in glob('*.gz'):
-                    hs = openfasta(f)
-                    for h, s in hs:
-                        if s in seqs:
-                            seqs[s].append(h)
-                        else:
-                            seqs[s] = [h]
-                    os.remove(f)
-                nlen, L = [], len(seqs)
-                for k, v in seqs.items():
-                    nseqs = [x.split('_')[0] for x in v]
-                    nseqs = set(nseqs)
-                    nseqs = len(nseqs)
-                    nlen.append(nseqs*100/N)
-                nlen = np.asarray(nlen)
-                res = []
-                for cutoff in range(0, 101):
-                    k = sum(nlen >= cutoff)
-                    res.append((cutoff, k, k*100/L))
+                infiles = sorted(glob('*.gz'))
+                genomes = [f.split('.')[0] for f in infiles]
+                sequences = dict()
+                bitsets = genome_bitsets(infiles, sequences)
+                for f in infiles: os.remove(f)
+                hist = prevalence_histogram(bitsets, N)
+                res = prevalence_curve(hist, N)
                 df = pd.DataFrame(res,
                                   columns=['cutoff_prevalence',
                                            'number of proteins',
@@ -98,10 +67,16 @@ with open('Notes.txt', 'a') as output:
                           sep='\t',
                           header=True,
                           index=None)
+                # sequence -> genomes where it was found (the part of the
+                # headers before '_', which is all later steps use)
+                seqs = {sequences.pop(d): [genomes[g] for g in members(b)]
+                        for d, b in bitsets.items()}
+                del bitsets
                 with open(f'analysis/{c}_seqs.pkl', 'wb') as handle:
                     pkl.dump(seqs,
                              handle,
                              protocol=pkl.HIGHEST_PROTOCOL)    
+                del seqs
                 families()
             else:
                 print(f'ERROR for cluster {c}, no sequences appended')
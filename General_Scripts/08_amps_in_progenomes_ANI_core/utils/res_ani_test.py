@@ -1,3 +1,43 @@
+def genome_index(proteins, levels):
+    '''
+    Index proteins and protein families by genome
+
+    Inputs: proteins - dict of sequence to list of protein names, whose
+                       prefix (until the first '_') is the genome
+            levels - dict of sequence to protein family (sequences
+                     without a family belong to 'NA')
+    Returns: (genome -> set of protein ids, genome -> set of families)
+             proteins are numbered in the order of the input dict
+    '''
+    from collections import defaultdict
+    genes = defaultdict(set)
+    fams = defaultdict(set)
+    for pid, (k, v) in enumerate(proteins.items()):
+        family = levels.get(k, 'NA')
+        for genome in {x.split('_')[0] for x in v}:
+            genes[genome].add(pid)
+            fams[genome].add(family)
+    return genes, fams
+
+
+def amp_index(amps):
+    '''
+    Index AMPs and AMP families by genome
+
+    Inputs: amps - dataframe with columns sample, amp and fam
+    Returns: (genome -> set of AMPs, genome -> set of AMP families)
+    '''
+    grouped = amps.groupby('sample')
+    return (grouped['amp'].agg(set).to_dict(),
+            grouped['fam'].agg(set).to_dict())
+
+
+def _overlap(a, b):
+    # total and shared elements of two sets
+    shared = len(a & b)
+    return len(a) + len(b) - shared, shared
+
+
 def checkres(cluster: str, amps):
     import pandas as pd
     import pickle as pkl
@@ -26,31 +66,23 @@ def checkres(cluster: str, amps):
     levels = levels['L-III']
     print(f'loaded {len(levels)} protein families')
     
+    genes, fams = genome_index(b, levels)
+    amp_genes, amp_fams = amp_index(amps)
+    empty = frozenset()
+    
     nlist = list()
     for _, s1, s2, og, of, _ in df.itertuples():
         if s1 != s2:
-            s1genes, s1fams = (set(), set())
-            s2genes, s2fams = (set(), set())
-            for k, v in b.items():
-                v = {x.split('_')[0] for x in v}
-                family = levels.get(k, 'NA')
-                if s1 in v:
-                    s1genes.add(k)
-                    s1fams.add(family)
-                if s2 in v:
-                    s2genes.add(k)
-                    s2fams.add(family)
-                
-            total, shared = len(s1genes.union(s2genes)), len(s1genes.intersection(s2genes))
-            ftotal, fshared = len(s1fams.union(s2fams)), len(s1fams.intersection(s2fams))
+            s1genes, s1fams = genes.get(s1, empty), fams.get(s1, empty)
+            s2genes, s2fams = genes.get(s2, empty), fams.get(s2, empty)
+            total, shared = _overlap(s1genes, s2genes)
+            ftotal, fshared = _overlap(s1fams, s2fams)
             
-            a1 = set(amps.loc[amps['sample'] == s1, 'amp'])
-            a2 = set(amps.loc[amps['sample'] == s2, 'amp'])
-            tamp, sharedamp = len(a1.union(a2)), len(a1.intersection(a2))
+            a1, a2 = amp_genes.get(s1, empty), amp_genes.get(s2, empty)
+            tamp, sharedamp = _overlap(a1, a2)
             
-            fa1 = set(amps.loc[amps['sample'] == s1, 'fam'])
-            fa2 = set(amps.loc[amps['sample'] == s2, 'fam'])
-            ftamp, fsharedamp = len(fa1.union(fa2)), len(fa1.intersection(fa2))
+            fa1, fa2 = amp_fams.get(s1, empty), amp_fams.get(s2, empty)
+            ftamp, fsharedamp = _overlap(fa1, fa2)
             
             nlist.append([s1, s2, cluster, og, of,
                           len(s1genes), len(s2genes),
@@ -24,53 +24,161 @@ def convname(ampcode: str) -> str:
     return int(ampcode[6:])
 
 
-def preprocess_files():
+def gene_index():
+    '''
+    Dictionary of genes to AMP rows, and the number of AMPs
+    '''
+    headers = pd.read_table('data/headers.tsv.xz',
+                            sep='\t',
+                            header='infer')
+    tamps = headers.AMP.nunique()
+    genes = dict(zip(headers.gene, headers.AMP.apply(convname)))
+    return genes, tamps
+
+
+_genes = None
+
+
+def _init_worker(genes):
+    global _genes
+    _genes = genes
+
+
+def map_sample(fname: str):
+    '''
+    Sample and AMP rows (int32, unique and sorted) of a mapping result,
+    read as a stream
+    '''
+    rows = set()
+    sample = None
+    with lzma.open(fname, 'rt') as handle:
+        for line in handle:
+            if line.startswith('#'):
+                continue
+            gene = line[:line.find('\t')]
+            if sample is None:
+                # header: the first column after the genes is the sample
+                sample = line.rstrip('\n').split('\t')[1]
+                continue
+            if gene != '-1':
+                rows.add(_genes[gene])
+    return sample, np.array(sorted(rows), dtype=np.int32)
+
+
+MANIFEST = 'analysis/processed_files.txt'
+
+
+def load_processed():
+    '''
+    Mapping results already in the saved sparse matrix
+
+    The manifest is written last, so the matrix and the list of samples
+    can have extra columns from an interrupted run, which are dropped.
+    If any of them is missing or has fewer columns than the manifest,
+    nothing is loaded (and the matrix is rebuilt)
+
+    Outputs:
+    1 = list of samples
+    2 = list of mapping files in the matrix (manifest)
+    3 = sparse matrix (coo), or None
+    '''
+    paths = [MANIFEST,
+             'analysis/saved_sample_cols.txt',
+             'analysis/sparse_matrix.npz']
+    if not all(exists(x) for x in paths):
+        return [], [], None
+    with open(MANIFEST) as handle:
+        done = handle.read().split()
+    with open('analysis/saved_sample_cols.txt') as handle:
+        samples_list = handle.read().split()
+    data = load_npz('analysis/sparse_matrix.npz')
+    n = len(done)
+    if len(samples_list) < n or data.shape[1] < n:
+        print('Saved sparse matrix does not match the manifest')
+        return [], [], None
+    if data.shape[1] > n:
+        print(f'Dropping {data.shape[1] - n} columns of an interrupted run')
+        data = data.tocsc()[:, :n].tocoo()
+    print(f'{n} mapping results already in the sparse matrix')
+    return samples_list[:n], done, data
+
+
+def preprocess_files(workers: int=None, rebuild: bool=False):
     '''
     Join mapping results for AMP genes against sample reads
+
+    Mapping files are processed in parallel, and those already in the
+    sparse matrix (listed in MANIFEST) are skipped,
+    new samples being appended as new columns
+
     Outputs:
     samples_list = list of samples which the index in the list match to the column index in the sparse matrix
-    data = sparse matrix (lil) of presence/absence with the rows being AMPs and columns being samples
+    data = sparse matrix (coo) of presence/absence with the rows being AMPs and columns being samples
     '''
+    from concurrent.futures import ProcessPoolExecutor
+    from scipy.sparse import hstack
+    files = sorted(glob('data/uniques/*.xz'))
+    samples_list, done, old = [], [], None
+    if not rebuild:
+        samples_list, done, old = load_processed()
+    elif exists(MANIFEST):
+        # the saved matrix is no longer described by the manifest
+        os.remove(MANIFEST)
+    seen = set(done)
+    new = [f for f in files if f not in seen]
+    if old is not None and not new:
+        return (samples_list, old)
+
     print('Load dict of genes to proteins')
-    headers = pd.read_table('data/headers.tsv.xz',
-                            sep='\t',
-                            header='infer',
-                            index_col='gene')
-    n = len(glob('data/uniques/*.xz'))
-    tamps = len(set(headers.AMP))
-    headers['AMP'] = headers.AMP.apply(convname)
-    headers = headers.to_dict()
-    headers = headers['AMP']
+    genes, tamps = gene_index()
+
     print('Processing mapping results')
-    samples_list = []
-    row, col = [], []
-    for idx, data in tqdm(enumerate(glob('data/uniques/*.xz')), total=n):
-        data = pd.read_table(data,
-                             comment='#',
-                             index_col=0)
-        samples_list.append(data.columns[0])
-        if '-1' in data.index: data.drop('-1', axis=0, inplace=True)
-        elif -1 in data.index: data.drop(-1, axis=0, inplace=True)
-        if len(data) != 0:
-            amps = {headers.get(x) for x in data.index}
-            for x in amps:
-                row.append(x)
-                col.append(idx)
+    offset = len(done)
+    row = np.zeros(1 << 20, dtype=np.int32)
+    col = np.zeros(1 << 20, dtype=np.int32)
+    pos = 0
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(genes,)) as executor:
+        results = executor.map(map_sample, new, chunksize=4)
+        for idx, (sample, amps) in tqdm(enumerate(results), total=len(new)):
+            samples_list.append(sample)
+            if pos + len(amps) > len(row):
+                size = max(2 * len(row), pos + len(amps))
+                row = np.resize(row, size)
+                col = np.resize(col, size)
+            row[pos:pos + len(amps)] = amps
+            col[pos:pos + len(amps)] = idx
+            pos += len(amps)
+
     print('Producing sparse matrix')
-    print(f'Matrix def: ({n}, {tamps})')
-    data = np.ones_like(row, dtype=np.uint8)
-    data = coo_matrix((data, (row, col)),
-                      shape=(tamps, n),
+    print(f'Matrix def: ({offset + len(new)}, {tamps})')
+    data = coo_matrix((np.ones(pos, dtype=np.uint8), (row[:pos], col[:pos])),
+                      shape=(tamps, len(new)),
                       dtype=np.uint8)
-    save_npz('analysis/sparse_matrix.npz', data)  # to load: scipy.sparse.load_npz('sparse_matrix.npz')
-    with open('analysis/saved_sample_cols.txt', 'w') as handle:
+    if old is not None:
+        data = hstack([old, data], format='coo', dtype=np.uint8)
+    os.makedirs('analysis', exist_ok=True)
+    # all outputs are written to temporary files first, and the manifest
+    # is replaced last: files are only appended, so load_processed can
+    # always trim the matrix and samples back to the files in the manifest
+    save_npz('analysis/sparse_matrix.tmp.npz', data)  # to load: scipy.sparse.load_npz('sparse_matrix.npz')
+    with open('analysis/saved_sample_cols.txt.tmp', 'w') as handle:
         for x in samples_list: handle.write(f'{x}\n')
+    with open(f'{MANIFEST}.tmp', 'w') as handle:
+        for x in done + new: handle.write(f'{x}\n')
+    os.replace('analysis/sparse_matrix.tmp.npz', 'analysis/sparse_matrix.npz')
+    os.replace('analysis/saved_sample_cols.txt.tmp', 'analysis/saved_sample_cols.txt')
+    os.replace(f'{MANIFEST}.tmp', MANIFEST)
     return (samples_list, data)
 
 
-def load_precomputed(override: bool=False):
+def load_precomputed(override: bool=False, workers: int=None):
     if not override:
         print('Trying to retrieve saved files info')
+        if exists(MANIFEST):
+            # adds samples not processed yet, if any
+            return preprocess_files(workers)
         if exists('analysis/saved_sample_cols.txt'):
             print('Loading samples')
             samples = []
@@ -81,7 +189,7 @@ def load_precomputed(override: bool=False):
                 df = load_npz('analysis/sparse_matrix.npz')
                 return (samples, df)
     print('Starting general process')
-    return preprocess_files()
+    return preprocess_files(workers, rebuild=True)
 
 
 def metadata():
@@ -96,49 +204,105 @@ def metadata():
     return (envo['general_envo_name'], envo['high'])
 
 
-def export_tables(protmap_res: list, samples_h: list, samples_g: list):
-    from collections import Counter
-    print('Creating and setting variables')
-    nsamples, ghabs, hhabs = [], [], []
-    g, h = set(samples_g), set(samples_h)
-    a, b = np.array(samples_h), np.array(samples_g)
-    print('Creating tables for output')
-    ghabs_out = lzma.open('analysis/unique_map_cAMPs_general_habs.tsv.xz', 'wt')
-    gnames = '\t'.join(['AMP', *tuple(g)])
-    ghabs_out.write(f'{gnames}\n')
-    nsamples_out = lzma.open('analysis/unique_map_cAMPs_nsamples.tsv.xz', 'wt')
-    nsamples_out.write('AMP\tnsamples\n')
-    hhabs_out = lzma.open('analysis/unique_map_cAMPs_high_habs.tsv.xz', 'wt')
-    hnames = '\t'.join(['AMP', *tuple(h)])
-    hhabs_out.write(f'{hnames}\n')
-    print('Processing results')
-    for idx in tqdm(range(protmap_res.shape[0]), total=protmap_res.shape[0]):
-        v = protmap_res[idx].nonzero()[1]
-        n = str(len(v))
-        name = str(idx).zfill(6)
-        name = 'AMP10.'+'_'.join([name[0:3], name[3:]])
-        nsamples_out.write(f'{name}\t{n}\n')
-        g_coo = dict(Counter(b[v]))
-        g_coo = [ g_coo.get(x, 0) for x in g ]
-        g_coo.insert(0, name)
-        g_coo = '\t'.join([str(w) for w in g_coo])
-        ghabs_out.write(f'{g_coo}\n')
-        h_coo =  dict(Counter(a[v]))
-        h_coo = [ h_coo.get(x, 0) for x in h ]
-        h_coo.insert(0, name)
-        h_coo = '\t'.join([str(w) for w in h_coo])
-        hhabs_out.write(f'{h_coo}\n')
-    print('Closing inputs')
-    hhabs_out.close()
-    nsamples_out.close()
-    ghabs_out.close()
-
-
-samples, df = load_precomputed()
-h, hi = metadata()
-samples_g = [h.get(x) for x in samples]
-samples_h = [hi.get(x) for x in samples]
-df = df.tocsr()
-print('Export tables')
-export_tables(df, samples_h, samples_g)
+def habitat_counts(protmap_res, labels: list):
+    '''
+    Number of samples of each habitat in which each AMP was found
+
+    The AMP x sample matrix is multiplied by the (sparse) sample x
+    habitat one-hot matrix
+
+    Outputs:
+    1 = list of habitats (sorted)
+    2 = sparse matrix (csr) of counts with AMPs in rows and habitats in columns
+    '''
+    from scipy.sparse import csr_matrix
+    names = sorted(set(labels), key=str)
+    index = {x: i for i, x in enumerate(names)}
+    codes = np.array([index[x] for x in labels], dtype=np.int64)
+    onehot = csr_matrix((np.ones(len(codes), dtype=np.int32),
+                         (np.arange(len(codes)), codes)),
+                        shape=(len(codes), len(names)))
+    return names, (protmap_res @ onehot).tocsr()
+
+
+def amp_names(start: int, end: int) -> list:
+    '''
+    AMP access codes of rows in the interval [start, end)
+    Example: 0 = AMP10.000_000
+    '''
+    return [f'AMP10.{i // 1000:03d}_{i % 1000:03d}' for i in range(start, end)]
+
+
+def table_blocks(counts, columns: list, block: int=100_000):
+    '''
+    Table of counts (dense array or sparse matrix, with AMPs in rows)
+    formatted as tsv in blocks of rows, the first one with the header
+    '''
+    for start in range(0, counts.shape[0], block):
+        end = min(start + block, counts.shape[0])
+        values = counts[start:end]
+        if hasattr(values, 'toarray'):
+            values = values.toarray()
+        values = pd.DataFrame(values.reshape(end - start, -1),
+                              index=amp_names(start, end),
+                              columns=columns)
+        yield values.to_csv(sep='\t',
+                            header=(start == 0),
+                            index_label='AMP')
+
+
+def write_xz(ofile: str, blocks, threads: int=1):
+    '''
+    Writes blocks of text to an xz file, compressing up to `threads`
+    blocks at a time, each as its own xz stream (concatenated streams
+    are read as a single file)
+    '''
+    from itertools import islice
+    from concurrent.futures import ThreadPoolExecutor
+    blocks = iter(blocks)
+    with open(ofile, 'wb') as out, \
+            ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            window = list(islice(blocks, threads))
+            if not window:
+                break
+            for data in executor.map(lambda x: lzma.compress(x.encode()), window):
+                out.write(data)
+
+
+def export_tables(protmap_res, samples_h: list, samples_g: list, threads: int=1):
+    '''
+    Writes the number of samples in which each AMP was found, in total
+    and per general and high-level habitats
+
+    Inputs:
+    protmap_res = sparse matrix of presence/absence with the rows being AMPs and columns being samples
+    samples_h = high-level habitat of each sample (column)
+    samples_g = general habitat of each sample (column)
+    threads = number of threads compressing the outputs
+    '''
+    print('Counting samples per habitat')
+    presence = protmap_res.tocsr().astype(bool).astype(np.int32)
+    nsamples = np.diff(presence.indptr)
+    gnames, gcounts = habitat_counts(presence, samples_g)
+    hnames, hcounts = habitat_counts(presence, samples_h)
+    print('Writing tables')
+    write_xz('analysis/unique_map_cAMPs_nsamples.tsv.xz',
+             table_blocks(nsamples, ['nsamples']),
+             threads)
+    write_xz('analysis/unique_map_cAMPs_general_habs.tsv.xz',
+             table_blocks(gcounts, gnames),
+             threads)
+    write_xz('analysis/unique_map_cAMPs_high_habs.tsv.xz',
+             table_blocks(hcounts, hnames),
+             threads)
+
+
+if __name__ == '__main__':
+    samples, df = load_precomputed(workers=os.cpu_count())
+    h, hi = metadata()
+    samples_g = [h.get(x) for x in samples]
+    samples_h = [hi.get(x) for x in samples]
+    print('Export tables')
+    export_tables(df, samples_h, samples_g, threads=os.cpu_count())
 
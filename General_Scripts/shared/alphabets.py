@@ -0,0 +1,149 @@
+'''
+Reduced amino acid alphabets used to cluster AMPs
+
+Residues are grouped as in Murphy et al. (doi: 10.1093/protein/13.3.149),
+each group being written as its first letter. AMPSphere families were
+built with the 8-letter alphabet:
+
+    [LVMIC], [AG], [ST], P, [FWY], [EDQN], [KR], H
+
+10- and 12-letter alphabets from the same work can be used instead:
+
+    10: [LVMI], C, A, G, [ST], P, [FWY], [EDQN], [KR], H
+    12: [LVMI], C, A, G, [ST], P, [FY], W, [EQ], [DN], [KR], H
+
+Residues outside the groups (e.g. X) are kept unchanged.
+
+Sequences are reduced with `str.translate` over a precomputed table.
+Many sequences are reduced at once by joining them, so that the whole
+chunk is translated in a single call.
+
+To compare with the previous (character by character) implementation:
+
+    python ../shared/alphabets.py analysis/AMPsphere_GMSC_correspondence.tsv.gz
+'''
+
+# Refs:
+# doi: 10.1093/protein/13.3.149
+# doi: 10.1093/bioinformatics/btp164
+# Solis, AD. Proteins 2015; 83:2198–2216.
+ALPHABETS = {'8': ['LVMIC', 'AG', 'ST', 'P', 'FWY', 'EDQN', 'KR', 'H'],
+             '10': ['LVMI', 'C', 'A', 'G', 'ST', 'P', 'FWY', 'EDQN', 'KR', 'H'],
+             '12': ['LVMI', 'C', 'A', 'G', 'ST', 'P', 'FY', 'W', 'EQ', 'DN',
+                    'KR', 'H']}
+
+_tables = {}
+
+
+def groups(alphabet='8'):
+    '''
+    Residues represented by each letter of the reduced alphabet, e.g.
+    {'L': ['L', 'V', 'M', 'I', 'C'], 'A': ['A', 'G'], ...}
+    '''
+    return {g[0]: list(g) for g in ALPHABETS[alphabet]}
+
+
+def translation_table(alphabet='8'):
+    '''Table for `str.translate` reducing sequences to `alphabet`'''
+    if alphabet not in _tables:
+        _tables[alphabet] = str.maketrans({aa: g[0]
+                                           for g in ALPHABETS[alphabet]
+                                           for aa in g})
+    return _tables[alphabet]
+
+
+def reduce_seq(seq, alphabet='8'):
+    '''Reduce one sequence to `alphabet`'''
+    return seq.strip().translate(translation_table(alphabet))
+
+
+def reduce_many(seqs, alphabet='8', chunk=100_000):
+    '''
+    Reduce an iterable of sequences, yielding them in the same order
+
+    Sequences are translated in chunks of `chunk` sequences
+    '''
+    from itertools import islice
+
+    table = translation_table(alphabet)
+    seqs = iter(seqs)
+    while True:
+        block = [s.strip() for s in islice(seqs, chunk)]
+        if not block:
+            break
+        yield from '\n'.join(block).translate(table).split('\n')
+
+
+def write_reduced_fasta(seqs, ofile, alphabet='8', chunk=100_000):
+    '''
+    Write a FASTA file whose headers are the original sequences and whose
+    sequences are reduced to `alphabet` (input of the clustering)
+    '''
+    from itertools import islice
+
+    table = translation_table(alphabet)
+    seqs = iter(seqs)
+    with open(ofile, 'w') as out:
+        while True:
+            block = [s.strip() for s in islice(seqs, chunk)]
+            if not block:
+                break
+            reduced = '\n'.join(block).translate(table).split('\n')
+            out.write(''.join(f'>{s}\n{r}\n' for s, r in zip(block, reduced)))
+
+
+def _concat_reduce(seq, alphabet='8'):
+    # character by character implementation used before, kept as a
+    # reference for `benchmark`
+    aas = {aa: g[0] for g in ALPHABETS[alphabet] for aa in g}
+    nseq = ''
+    for i in seq.strip():
+        nseq += aas.get(i, i)
+    return nseq
+
+
+def benchmark(infile, alphabet='8'):
+    '''
+    Time the reduction of all sequences in the `sequence` column of
+    `infile` (e.g. AMPsphere_GMSC_correspondence.tsv.gz)
+    '''
+    import os
+    import time
+    import tempfile
+    import pandas as pd
+
+    seqs = pd.read_table(infile, usecols=['sequence'])['sequence'].tolist()
+
+    def timed(fn):
+        start = time.perf_counter()
+        res = fn()
+        return res, time.perf_counter() - start
+
+    ref, t_concat = timed(lambda: [_concat_reduce(s, alphabet) for s in seqs])
+    single, t_single = timed(lambda: [reduce_seq(s, alphabet) for s in seqs])
+    batch, t_batch = timed(lambda: list(reduce_many(seqs, alphabet)))
+    assert ref == single == batch
+
+    fd, tmp = tempfile.mkstemp(suffix='.fa')
+    os.close(fd)
+    try:
+        _, t_fasta = timed(lambda: write_reduced_fasta(seqs, tmp, alphabet))
+    finally:
+        os.unlink(tmp)
+
+    print(f'Sequences: {len(seqs)} ({alphabet}-letter alphabet)')
+    print(f'concatenation:           {t_concat:8.2f} s')
+    print(f'str.translate:           {t_single:8.2f} s')
+    print(f'str.translate (batch):   {t_batch:8.2f} s')
+    print(f'batch to clustering fasta: {t_fasta:6.2f} s')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark the reduction of sequences to a reduced alphabet')
+    parser.add_argument('infile')
+    parser.add_argument('--alphabet', choices=sorted(ALPHABETS), default='8')
+    args = parser.parse_args()
+    benchmark(args.infile, args.alphabet)
@@ -0,0 +1,312 @@
+'''
+Indexed, random-access store for AMPSphere FASTA files
+
+The first time a FASTA file (plain, .gz, .bz2 or .xz) is opened, it is
+parsed once and an index is written next to it, in `<fasta>.idx/`:
+
+    seqs.bin          all sequences concatenated, without separators
+    offsets.npy       start of each sequence in seqs.bin (n + 1 entries)
+    ids.npy           identifiers (first word of the header), in file order
+    labels.npy        second field of headers such as
+                      `>AMP10.000_000 | SPHERE-III.001_396`
+    id_order.npy      permutation sorting the identifiers
+    label_order.npy   permutation sorting the labels
+    source.json       size and modification time of the FASTA file
+
+Afterwards the index is only memory-mapped, so fetching one accession,
+all members of a family (label), or streaming every record does not
+parse the FASTA file again. The index is rebuilt if the FASTA changes.
+
+Example:
+
+    from seqstore import load_index, fetch, fetch_group, seqdict
+    index = load_index('data/AMPSphere_v.2022-03.faa.gz')
+    fetch(index, 'AMP10.000_000')
+    list(fetch_group(index, 'SPHERE-III.001_396'))
+    seqs = seqdict('data/AMPSphere_v.2022-03.faa.gz')
+
+Load times can be compared against Bio.SeqIO with:
+
+    python ../shared/seqstore.py data/AMPSphere_v.2022-03.faa.gz
+'''
+
+import os
+import json
+import numpy as np
+
+
+def _open(fname):
+    if fname.endswith('.gz'):
+        import gzip
+        return gzip.open(fname, 'rt', encoding='utf-8')
+    if fname.endswith('.bz2'):
+        import bz2
+        return bz2.open(fname, 'rt', encoding='utf-8')
+    if fname.endswith('.xz'):
+        import lzma
+        return lzma.open(fname, 'rt', encoding='utf-8')
+    return open(fname, 'rt', encoding='utf-8')
+
+
+def _split_header(header):
+    fields = header.split(' | ')
+    words = fields[0].split()
+    ident = words[0] if words else ''
+    label = fields[1].strip() if len(fields) > 1 else ''
+    return ident, label
+
+
+def parse_fasta(fname):
+    '''
+    Iterate over a (possibly compressed) FASTA file
+
+    Yields
+    ------
+    (identifier, label, sequence) : tuple of str
+        label is the second field of headers separated by ' | ', or an
+        empty string if there is none
+    '''
+    header = None
+    chunks = []
+    with _open(fname) as f:
+        for line in f:
+            if line[0] == '>':
+                if header is not None:
+                    yield _split_header(header) + (''.join(chunks),)
+                header = line[1:].strip()
+                chunks = []
+            else:
+                chunks.append(line.strip())
+        if header is not None:
+            yield _split_header(header) + (''.join(chunks),)
+
+
+def _source_info(fasta):
+    st = os.stat(fasta)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def _is_fresh(fasta, index_dir):
+    meta = f'{index_dir}/source.json'
+    if not os.path.exists(meta):
+        return False
+    with open(meta) as f:
+        return json.load(f) == _source_info(fasta)
+
+
+def build_index(fasta, index_dir=None):
+    '''
+    Parse `fasta` once and write its index to `index_dir`
+    (default: `<fasta>.idx`)
+    '''
+    import shutil
+
+    if index_dir is None:
+        index_dir = f'{fasta}.idx'
+    tmp = f'{index_dir}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    ids, labels, offsets = [], [], [0]
+    with open(f'{tmp}/seqs.bin', 'wb') as out:
+        for ident, label, seq in parse_fasta(fasta):
+            seq = seq.encode('ascii')
+            out.write(seq)
+            ids.append(ident.encode('ascii'))
+            labels.append(label.encode('ascii'))
+            offsets.append(offsets[-1] + len(seq))
+
+    ids = np.array(ids, dtype=bytes)
+    labels = np.array(labels, dtype=bytes)
+    np.save(f'{tmp}/offsets.npy', np.array(offsets, dtype=np.int64))
+    np.save(f'{tmp}/ids.npy', ids)
+    np.save(f'{tmp}/labels.npy', labels)
+    np.save(f'{tmp}/id_order.npy', np.argsort(ids, kind='stable'))
+    np.save(f'{tmp}/label_order.npy', np.argsort(labels, kind='stable'))
+    with open(f'{tmp}/source.json', 'w') as f:
+        json.dump(_source_info(fasta), f)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp, index_dir)
+    return index_dir
+
+
+def load_index(fasta, index_dir=None):
+    '''
+    Memory-map the index of `fasta`, building it first if it is missing
+    or out of date
+
+    Returns
+    -------
+    index : dict
+        Used by `fetch`, `fetch_group`, `iter_records`
+    '''
+    import mmap
+
+    if index_dir is None:
+        index_dir = f'{fasta}.idx'
+    if not _is_fresh(fasta, index_dir):
+        build_index(fasta, index_dir)
+
+    index = {name: np.load(f'{index_dir}/{name}.npy', mmap_mode='r')
+             for name in ['offsets',
+                          'ids',
+                          'labels',
+                          'id_order',
+                          'label_order']}
+    with open(f'{index_dir}/seqs.bin', 'rb') as f:
+        if index['offsets'][-1]:
+            index['seqs'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            index['seqs'] = b''
+    return index
+
+
+def _lower_bound(values, order, key):
+    # binary search through the sorting permutation, so that the sorted
+    # array never needs to be materialised
+    lo, hi = 0, len(order)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[order[mid]] < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _sequence(index, i):
+    offsets = index['offsets']
+    return index['seqs'][offsets[i]:offsets[i+1]].decode('ascii')
+
+
+def _find(index, accession):
+    key = accession.encode('ascii')
+    pos = _lower_bound(index['ids'], index['id_order'], key)
+    if pos < len(index['id_order']):
+        i = index['id_order'][pos]
+        if index['ids'][i] == key:
+            return i
+    return None
+
+
+def fetch(index, accession, default=None):
+    '''
+    Sequence of `accession`, or `default` if it is not in the index
+    '''
+    i = _find(index, accession)
+    if i is None:
+        return default
+    return _sequence(index, i)
+
+
+def fetch_label(index, accession, default=None):
+    '''
+    Label (e.g. family) of `accession`, or `default` if it is not in the
+    index
+    '''
+    i = _find(index, accession)
+    if i is None:
+        return default
+    return index['labels'][i].decode('ascii')
+
+
+def fetch_group(index, label):
+    '''
+    Iterate over (identifier, sequence) of all records with a given label
+    (e.g. all peptides of a family), in file order
+    '''
+    key = label.encode('ascii')
+    labels, order = index['labels'], index['label_order']
+    start = _lower_bound(labels, order, key)
+    end = start
+    while end < len(order) and labels[order[end]] == key:
+        end += 1
+    for i in np.sort(order[start:end]):
+        yield index['ids'][i].decode('ascii'), _sequence(index, i)
+
+
+def iter_records(index, chunk=100_000):
+    '''
+    Iterate over (identifier, label, sequence) of all records, in file
+    order
+    '''
+    seqs = index['seqs']
+    n = len(index['ids'])
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        offsets = index['offsets'][start:end+1].tolist()
+        ids = index['ids'][start:end].tolist()
+        labels = index['labels'][start:end].tolist()
+        for j, (ident, label) in enumerate(zip(ids, labels)):
+            yield (ident.decode('ascii'),
+                   label.decode('ascii'),
+                   seqs[offsets[j]:offsets[j+1]].decode('ascii'))
+
+
+def seqdict(fasta, index_dir=None):
+    '''
+    Load the sequences of `fasta` as a dictionary of identifier to sequence
+    '''
+    index = load_index(fasta, index_dir)
+    return {ident: seq for ident, _, seq in iter_records(index)}
+
+
+def labeldict(fasta, index_dir=None):
+    '''
+    Load the labels of `fasta` as a dictionary of identifier to label
+    '''
+    index = load_index(fasta, index_dir)
+    return dict(zip(np.char.decode(index['ids'], 'ascii').tolist(),
+                    np.char.decode(index['labels'], 'ascii').tolist()))
+
+
+def benchmark(fasta, n_fetch=10_000):
+    '''
+    Compare the time to load all sequences of `fasta` with Bio.SeqIO
+    against building the index (cold) and reusing it (warm)
+    '''
+    import time
+    import random
+    import shutil
+    import tempfile
+    from Bio import SeqIO
+
+    def timed(fn):
+        start = time.perf_counter()
+        res = fn()
+        return res, time.perf_counter() - start
+
+    def seqio():
+        with _open(fasta) as f:
+            return {r.id: str(r.seq) for r in SeqIO.parse(f, 'fasta')}
+
+    tmp = tempfile.mkdtemp()
+    index_dir = f'{tmp}/index'
+    try:
+        ref, t_seqio = timed(seqio)
+        cold, t_cold = timed(lambda: seqdict(fasta, index_dir))
+        warm, t_warm = timed(lambda: seqdict(fasta, index_dir))
+        assert ref == cold == warm
+
+        index = load_index(fasta, index_dir)
+        sample = random.sample(list(ref), min(n_fetch, len(ref)))
+        _, t_fetch = timed(lambda: [fetch(index, x) for x in sample])
+    finally:
+        shutil.rmtree(tmp)
+
+    print(f'Records: {len(ref)}')
+    print(f'SeqIO.parse (full load):         {t_seqio:8.2f} s')
+    print(f'seqstore cold (index + load):    {t_cold:8.2f} s')
+    print(f'seqstore warm (full load):       {t_warm:8.2f} s')
+    print(f'seqstore fetch ({len(sample)} accessions): {t_fetch:8.2f} s')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark the indexed sequence store')
+    parser.add_argument('fasta')
+    args = parser.parse_args()
+    benchmark(args.fasta)
@@ -0,0 +1,110 @@
+'''
+Columnar cache of the large master tables
+
+Tables such as gmsc_amp_genes_envohr_source.tsv.gz and
+complete_gmsc_pgenomes_metag.tsv.gz are converted once to Parquet, next to
+the original file (e.g. gmsc_amp_genes_envohr_source.parquet). Links are
+resolved first, so the analyses linking the same table from their data/
+folders share one cache. Text columns with repeated values (habitats,
+samples, specI, ...) are stored dictionary encoded, and can be loaded as
+pandas categoricals with `categories=True`.
+
+Later reads only load the requested columns, and rows can be filtered while
+reading, e.g.:
+
+    load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+               columns=['amp', 'general_envo_name'],
+               filters=[('is_metagenomic', '==', True)])
+
+The cache is rebuilt whenever the original table is newer than it.
+'''
+
+import os
+
+
+def cache_path(fname):
+    '''Parquet file caching a table (next to the file it links to)'''
+    fname = os.path.realpath(fname)
+    for ext in ('.tsv.gz', '.tsv.xz', '.tsv', '.tab'):
+        if fname.endswith(ext):
+            return fname[:-len(ext)] + '.parquet'
+    return fname + '.parquet'
+
+
+def _encode(df, max_ratio=0.5):
+    '''
+    Make text columns uniform, and categorical when they have at most
+    `max_ratio` distinct values per row
+    '''
+    from pandas.api.types import infer_dtype
+    for c in df.columns:
+        col = df[c]
+        kind = infer_dtype(col, skipna=True)
+        if kind.startswith('mixed'):
+            col = col.where(col.isna(), col.astype(str))
+        elif kind != 'string':
+            continue
+        if col.nunique() <= max_ratio * len(col):
+            col = col.astype('category')
+        df[c] = col
+    return df
+
+
+def convert(fname, ofile=None, row_group_size=1_000_000):
+    '''
+    Convert a tab separated table (with header) to Parquet
+
+    Returns the name of the Parquet file
+    '''
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if ofile is None:
+        ofile = cache_path(fname)
+    print(f'# caching {fname} as {ofile}')
+    df = pd.read_table(fname, sep='\t', header='infer', low_memory=False)
+    df = _encode(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = f'{ofile}.{os.getpid()}.tmp'
+    pq.write_table(table, tmp, row_group_size=row_group_size)
+    os.replace(tmp, ofile)
+    return ofile
+
+
+def cached_table(fname):
+    '''Parquet file of a table, converting it if needed'''
+    fname = os.path.realpath(fname)
+    ofile = cache_path(fname)
+    if not os.path.exists(ofile) or \
+            os.path.getmtime(ofile) < os.path.getmtime(fname):
+        convert(fname, ofile)
+    return ofile
+
+
+def load_table(fname, columns=None, filters=None, categories=False):
+    '''
+    Load a table through its columnar cache
+
+    :input:
+    - fname         original table (tab separated, with header)
+    - columns       list of columns to load (default: all)
+    - filters       row filters, as a list of (column, op, value) tuples
+                    combined with AND; op is one of ==, !=, <, <=, >, >=,
+                    in, not in. Filtered columns do not need to be loaded
+    - categories    keep dictionary encoded columns as categoricals,
+                    otherwise (default) they are returned with the
+                    dtype of their values, as read by pd.read_table
+
+    :output:
+    - dataframe with the selected rows and columns
+    '''
+    import pyarrow.parquet as pq
+    table = pq.read_table(cached_table(fname),
+                          columns=columns,
+                          filters=filters)
+    df = table.to_pandas()
+    if not categories:
+        for c in df.columns:
+            if df[c].dtype.name == 'category':
+                df[c] = df[c].astype(df[c].cat.categories.dtype)
+    return df
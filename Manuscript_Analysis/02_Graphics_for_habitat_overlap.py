@@ -23,23 +23,24 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 
 from itertools import chain, permutations
+from tables import load_table
 
 
 # In[281]:
 
 
 # load data
-data = pd.read_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz',
-                     sep='\t',
-                     header='infer')
+data = load_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz',
+                  columns=['amp', 'general_envo_name'],
+                  filters=[('is_metagenomic', '==', True)],
+                  categories=False)
 
 
 # In[282]:
 
 
 # filter duplicates
-data = data[data.is_metagenomic == True]
-data = data[['amp', 'general_envo_name']].drop_duplicates()
+data = data.drop_duplicates()
 data = data.groupby('general_envo_name')['amp'].apply(lambda x: set(x))
 
 
@@ -10,14 +10,15 @@ from scipy.stats import norm, shapiro
 from itertools import chain, permutations
 
 from environments import higher_level, color_map, animal_guts
+from tables import load_table
 
-data = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                     sep='\t',
-                     header='infer')
+data = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                  columns=['amp', 'general_envo_name'],
+                  filters=[('is_metagenomic', '==', True)],
+                  categories=False)
 
 # filter duplicates
-data = data.query('is_metagenomic')
-data = data[['amp', 'general_envo_name']].drop_duplicates()
+data = data.drop_duplicates()
 data = data.groupby('general_envo_name')['amp'].apply(set)
 
 # select environments with at least 100 peptides
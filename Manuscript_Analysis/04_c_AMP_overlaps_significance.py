@@ -4,22 +4,23 @@
 # 
 # We tested overlap of c_AMP contents of habitats presenting AMPs in at least 100 samples. Then, a permutation test was performed by shuffling the labels of samples and recalculating the overlap between each pair of habitats 32 times. The average and standard deviation overlap c_AMPs was calculated and the Z-score of the actual measure was computed. The p-value is then calculated using the survival function of *scipy.stats*.
 
+import os
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from tqdm import tqdm
-from random import shuffle
 from scipy.stats import norm, shapiro
-from itertools import chain, combinations
 
 from environments import higher_level, color_map, animal_guts
+from tables import load_table
+from overlap_permutations import sample_matrix, overlaps, permuted_overlaps
+from collector_curves import collector_curves
 
-data = pd.read_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
-                     sep='\t',
-                     header='infer')
-data = data.query('is_metagenomic')
-data = data[['amp', 'sample', 'general_envo_name']].drop_duplicates()
+data = load_table('data/gmsc_amp_genes_envohr_source.tsv.gz',
+                  columns=['amp', 'sample', 'general_envo_name'],
+                  filters=[('is_metagenomic', '==', True)],
+                  categories=False)
+data = data.drop_duplicates()
 
 
 # eliminating environments with less than 100 samples
@@ -30,69 +31,41 @@ envs100 = ec[ec >= 100].index
 df = data[data.general_envo_name.isin(set(envs100))].reset_index(drop=True)
 df['high'] = df.general_envo_name.map(higher_level.get)
 
-def permtest(df, n: int):
+def permtest(df, n: int, seed=1234, workers=1):
     '''
     Permutation test
     It accepts a data frame (df) consisting of at least three columns: amp, sample, environment
     [ 'general_envo_name' represents the column name with the environment labels ]
-    Then it selects subsets of the dataframe by environments v1 and v2
-    Shuffles the sample labels and calculate overlap
+    Calculates the overlap between each pair of environments (and of high level
+    environments), then shuffles the environment labels of samples n times
+    recalculating the overlaps
     '''
-    tests, testsh = [], []
-    envo, envo_h = set(df.general_envo_name), set(df.high)
-    habitat_list, hhabitat_list = list(combinations(envo, 2)), list(combinations(envo_h, 2))
+    matrix, codes, labels = sample_matrix(df)
+    highs = sorted({higher_level[x] for x in labels if x in higher_level})
+    hmapping = np.array([highs.index(higher_level[x]) if x in higher_level else -1
+                         for x in labels])
+    groupings = [(np.arange(len(labels)), len(labels)),
+                 (hmapping, len(highs))]
     print('Performing pair-wise comparisons')
-    alist = df.groupby('general_envo_name').apply(lambda x: set(x.amp))
-    alist = alist.reset_index().rename({0: 'amps'}, axis=1)
-    ahlist = df.groupby('high').apply(lambda x: set(x.amp))
-    ahlist = ahlist.reset_index().rename({0: 'amps'}, axis=1)
-    for v1, v2 in tqdm(habitat_list):
-        o1 = alist.loc[alist['general_envo_name'] == v1, 'amps'].tolist()[0]
-        o2 = alist.loc[alist['general_envo_name'] == v2, 'amps'].tolist()[0]
-        o = len(o1.intersection(o2))
-        tests.append((v1, v2, 'observed', o))
-    for v1, v2 in tqdm(hhabitat_list):
-        o1 = ahlist.loc[ahlist['high'] == v1, 'amps'].tolist()[0]
-        o2 = ahlist.loc[ahlist['high'] == v2, 'amps'].tolist()[0]
-        o = len(o1.intersection(o2))
-        testsh.append((v1, v2, 'observed', o))
-    del alist, ahlist
+    observed = [overlaps(matrix, mapping[codes], g) for mapping, g in groupings]
     print('Starting permutations')
-    ndf = df.groupby(['sample', 'general_envo_name']).apply(lambda x: set(x.amp))
-    ndf = ndf.reset_index()
-    ndf = ndf.rename({0: 'amp'}, axis=1)
-    labels = ndf['general_envo_name'].tolist()
-    for idx in tqdm(range(n)):
-        shuffle(labels)
-        ndf['general_envo_name'] = labels
-        ndf['high'] = [higher_level.get(x) for x in labels]
-        alist = ndf.groupby('general_envo_name').apply(lambda x: set(chain.from_iterable(x.amp)))
-        alist = alist.reset_index().rename({0: 'amps'}, axis=1)
-        ahlist = ndf.groupby('high').apply(lambda x: set(chain.from_iterable(x.amp)))
-        ahlist = ahlist.reset_index().rename({0: 'amps'}, axis=1)
-        for v1, v2 in habitat_list:
-            o1 = alist.loc[alist['general_envo_name'] == v1, 'amps'].tolist()[0]
-            o2 = alist.loc[alist['general_envo_name'] == v2, 'amps'].tolist()[0]
-            o = len(o1.intersection(o2))
-            tests.append((v1, v2, 'perm', o))
-        for v1, v2 in hhabitat_list:
-            o1 = ahlist.loc[ahlist['high'] == v1, 'amps'].tolist()[0]
-            o2 = ahlist.loc[ahlist['high'] == v2, 'amps'].tolist()[0]
-            o = len(o1.intersection(o2))
-            testsh.append((v1, v2, 'perm', o))
-    tests = pd.DataFrame(tests, columns=['env1', 'env2', 'test', 'overlap_AMPs'])
-    testsh = pd.DataFrame(testsh, columns=['env1', 'env2', 'test', 'overlap_AMPs'])
-    return (tests, testsh)
+    permuted = permuted_overlaps(matrix, codes, groupings, n,
+                                 seed=seed, workers=workers)
+    res = []
+    for names, obs, perm in zip([labels, highs], observed, permuted):
+        i, j = np.triu_indices(len(names), k=1)
+        names = np.array(names, dtype=object)
+        res.append(pd.DataFrame({
+            'env1': np.tile(names[i], n + 1),
+            'env2': np.tile(names[j], n + 1),
+            'test': np.repeat(['observed', 'perm'], [len(i), n * len(i)]),
+            'overlap_AMPs': np.concatenate([obs[None, i, j], perm[:, i, j]]).ravel()}))
+    return tuple(res)
 
 
 def test_perm(permutations, verbose: bool = None):
     res = []
-    habitat_list = set(permutations['env1']).union(set(permutations['env2']))
-    habitat_list = list(combinations(habitat_list, 2))
-    for v1, v2 in habitat_list:
-        xdf = permutations[(permutations.env1 == v1) & (permutations.env2 == v2)]
-        if len(xdf) == 0:
-            xdf = permutations[(permutations.env1 == v2) & (permutations.env2 == v1)]
+    for (v1, v2), xdf in permutations.groupby(['env1', 'env2'], sort=False):
         observed = xdf.loc[xdf.test == 'observed',
                            'overlap_AMPs'].tolist()[0]
         perms = xdf.loc[xdf.test == 'perm',
@@ -120,7 +93,7 @@ def test_perm(permutations, verbose: bool = None):
     return res
 
 
-permutations, permutationsh = permtest(df, 1000)
+permutations, permutationsh = permtest(df, 1000, workers=os.cpu_count())
 
 #exporting results
 permutations.to_csv('outputs/permutation_overlap_AMPs.tsv.gz',
@@ -172,12 +145,12 @@ def Chebyshev_inequality(num_std_deviations):
 
 # ### Creating Sample-based accumulation curves
 #
-# We generate sets of c_AMPs per sample, then group them by high/habitat. We then randomly select a path to continuously grow the curves. This random seed is then added consecutively to randomly selected samples and the number of AMPs is counted until end the process. The curve is computed 32 times for each environment and the average is plotted with the error for each dot.
+# We generate sets of c_AMPs per sample, then group them by high/habitat. The expected number of c_AMPs in k samples randomly selected from a habitat with L samples is then computed for every k (in steps of 10): a c_AMP present in f samples is missing from them with the hypergeometric probability C(L-f, k) / C(L, k). Curves averaged over random orders of the samples can be obtained with method='permutation'.
 
 # **Collector's curve for high level habitat groups**
 
 # selecting data
-itdf = df.groupby(['high', 'general_envo_name', 'sample'])['amp'].apply(lambda x: set(x)).reset_index()
+itdf = df[['high', 'general_envo_name', 'sample']].drop_duplicates()
 itdf
 
 
@@ -188,41 +161,11 @@ high_habitats = itdf.high.value_counts()
 high_habitats = high_habitats.sort_values()
 high_habitats = high_habitats.index
 
-
-
-def collectors(df, envo: str, col: str, perms=None, step=None):
-    if step == None: step = 10
-    if perms == None: perms = 32
-    n_itdf = df[df[col] == envo]['amp']
-    f = []
-    L = len(n_itdf)
-    for k in tqdm(range(1, L+1, step)):
-        if k != L:
-            presult = 0
-            for p in range(perms):
-                s = n_itdf.sample(k)
-                s = set(chain.from_iterable(s))
-                presult += len(s)
-            presult = presult / perms
-        else:
-            presult = len(set(chain.from_iterable(n_itdf)))
-        f.append(presult)
-    return (envo, f)
-
-ccurves = []
-for i in high_habitats:
-    h, c = collectors(df=itdf,
-                      envo=i,
-                      col='high',
-                      perms=32)
-
-    ccurves.append((h, c))
-
-avg_table = pd.DataFrame([x[1] for x in ccurves],
-                         index=[x[0] for x in ccurves]).T
-
-avg_table['samples'] = [(x*10)+1 for x in avg_table.index]
-avg_table = avg_table.set_index('samples')
+avg_table = collector_curves(df,
+                             col='high',
+                             habitats=high_habitats,
+                             step=10,
+                             workers=os.cpu_count())
 
 fig, ax = plt.subplots()
 sns.lineplot(data=avg_table/1000, palette='Dark2', ax=ax)
@@ -243,23 +186,11 @@ k = itdf.general_envo_name.value_counts()
 k = k.sort_values()
 k = k[k >= 100].index
 
-sitdf = itdf[itdf.general_envo_name.isin(k)]
-
-ccurves = []
-for i in k:
-    h, c = collectors(df=sitdf,
-                      envo=i,
-                      col='general_envo_name',
-                      perms=32)
-
-    ccurves.append((h, c))
-
-
-avg_table = pd.DataFrame([x[1] for x in ccurves],
-                         index=[x[0] for x in ccurves]).T
-
-avg_table['samples'] = [(x*10)+1 for x in avg_table.index]
-avg_table = avg_table.set_index('samples')
+avg_table = collector_curves(df,
+                             col='general_envo_name',
+                             habitats=k,
+                             step=10,
+                             workers=os.cpu_count())
 
 fig, ax = plt.subplots()
 sns.lineplot(data=avg_table/1000,
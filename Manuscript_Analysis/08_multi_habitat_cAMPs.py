@@ -18,17 +18,18 @@
 
 
 import lzma
-import random
+import os
 import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
 from Bio import SeqIO
-from tqdm import tqdm
 from scipy.stats import norm
 from scipy.stats import shapiro
 from scipy.stats import pearsonr, spearmanr
+from tables import load_table
+from multihabitat import sample_incidence, shuffle_test
 
 
 # In[2]:
@@ -103,7 +104,9 @@ higher_level = {'sediment' : 'other',
 
 
 # load data
-data = pd.read_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz')
+data = load_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz',
+                  columns=['amp', 'sample', 'general_envo_name'],
+                  categories=False)
 
 
 # In[4]:
@@ -169,39 +172,30 @@ with open('multihabitat_generalenvo.txt', 'wt') as out:
 
 # ### Permutation test
 # 
-# We shuffle the high-level habitat annotation for the samples, and then, calculate the number of multi-habitat c_AMPs. This operation is repeated 100 times, and then we calculate the average and standard deviation of the distribution of random results. Using Shapiro-Wilk test, we check if the random distribution is normal, and if it is, we calculate the Z-score for the result obtained for AMPSphere. The Z-score is then converted into a p-value to support our conclusions.
+# We shuffle the habitat annotation for the samples, and then, calculate the number of multi-habitat c_AMPs (for habitats and their high-level groups, over the same permutations). This operation is repeated 100 times, and then we calculate the average and standard deviation of the distribution of random results. Using Shapiro-Wilk test, we check if the random distribution is normal, and if it is, we calculate the Z-score for the result obtained for AMPSphere. The Z-score is then converted into a p-value to support our conclusions.
 
 # In[8]:
 
 
 # testing significance
-def shuffle_test(df, level=None):
-    if level == None: level = 'high'
-    elif level == 'low': level = 'general_envo_name'
-        
-    habitat = df.set_index('sample')[level].to_dict()
-    
-    values = [v for _, v in habitat.items()]
-    random.shuffle(values)
-    
-    for k, v in zip(habitat, values):
-        habitat[k] = v
-        
-    altdf = df.copy()
-    altdf[level] = altdf['sample'].map(lambda x: habitat.get(x))
-    
-    return altdf
+incidence, codes, labels = sample_incidence(data)
+highs = sorted(set(higher_level.get(x, 'other') for x in labels))
+hmapping = np.array([highs.index(higher_level.get(x, 'other')) for x in labels])
+
+tests = shuffle_test(incidence,
+                     codes,
+                     len(labels),
+                     [(hmapping, len(highs)),
+                      (np.arange(len(labels)), len(labels))],
+                     n=100,
+                     workers=os.cpu_count())
 
 
 # In[9]:
 
 
 #test high level habitats
-test = []
-for _ in tqdm(range(100)):
-    altdf = shuffle_test(data, 'high')
-    altdf = len(get_multihabitat(altdf, 'high'))
-    test.append(altdf)
+test = tests[:, 0].tolist()
 
 print(test)
 
@@ -234,11 +228,7 @@ print(f'This gives us a p-value of {pz}')
 
 
 #test habitats
-test_low = []
-for _ in tqdm(range(100)):
-    altdf = shuffle_test(data, 'low')
-    altdf = len(get_multihabitat(altdf, 'low'))
-    test_low.append(altdf)
+test_low = tests[:, 1].tolist()
 
 print(test_low)
 
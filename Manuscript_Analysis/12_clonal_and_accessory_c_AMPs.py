@@ -18,6 +18,7 @@ from scipy.stats import kstest
 from collections import Counter
 from scipy.stats import shapiro
 from scipy.stats import normaltest
+from tables import load_table
 
 
 def classificationprop(x):
@@ -46,13 +47,12 @@ spec_size = df.to_dict()
 # Then, we load the sources table and return a smaller version of it, only with meaningful columns to this analysis linking to the source resource
 
 
-refdata = pd.read_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz',
-                        sep='\t',
-                        header='infer')
+refdata = load_table('../data_folder/gmsc_amp_genes_envohr_source.tsv.gz',
+                     columns=['amp', 'sample', 'specI'],
+                     filters=[('is_metagenomic', '==', False)],
+                     categories=False)
 
-refdata = refdata.query('~is_metagenomic')
 refdata = refdata[~(refdata.specI.isna())]
-refdata = refdata[['amp','sample','specI']]
 refdata = refdata.sort_values(by=['amp', 'sample'])
 refdata = refdata.drop_duplicates()
 
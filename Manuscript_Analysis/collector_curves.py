@@ -0,0 +1,137 @@
+'''
+Collector's curves (sample-based rarefaction) of c_AMPs per habitat
+
+Samples are integer coded as rows of a sparse sample x c_AMP matrix.
+The expected number of c_AMPs in k random samples of a habitat with L
+samples is computed analytically: a c_AMP found in f of the samples is
+missing from the k samples with the hypergeometric probability
+C(L - f, k) / C(L, k), so that
+
+    E[c_AMPs(k)] = sum over c_AMPs of 1 - C(L - f, k) / C(L, k)
+
+which only depends on the histogram of prevalences. Alternatively, curves
+can be averaged over random orders of the samples: for each order, the
+position at which every c_AMP is first seen gives the whole curve at
+once.
+'''
+
+import numpy as np
+
+
+def habitat_matrices(df, col, habitats, sample='sample',
+                     label='general_envo_name', amp='amp'):
+    '''
+    Sparse (csc) sample x c_AMP matrix of each habitat
+
+    Samples are the pairs of sample and label, so a sample with two
+    labels grouped in the same habitat counts twice
+
+    :input:
+    - df        dataframe with sample, label, amp and `col` columns
+    - col       column with the habitats
+    - habitats  habitats of interest
+
+    :output:
+    - dictionary of habitat to matrix
+    '''
+    import pandas as pd
+    from scipy.sparse import csc_matrix
+    df = df[df[col].isin(set(habitats))]
+    df = df[[col, sample, label, amp]].drop_duplicates()
+    acodes, _ = pd.factorize(df[amp])
+    res = dict()
+    for h, idx in df.groupby(col).indices.items():
+        sub = df.iloc[idx]
+        units, _ = pd.factorize(pd.MultiIndex.from_arrays([sub[sample], sub[label]]))
+        amps, _ = pd.factorize(acodes[idx])
+        res[h] = csc_matrix((np.ones(len(sub), dtype=np.int8), (units, amps)),
+                            shape=(units.max() + 1, amps.max() + 1))
+    return res
+
+
+def expected_richness(matrix, ks, block=256):
+    '''
+    Expected number of c_AMPs in k random samples (rows of matrix), for
+    every k in ks
+    '''
+    from scipy.special import gammaln
+    L = matrix.shape[0]
+    prevalence = np.diff(matrix.indptr)
+    f, counts = np.unique(prevalence, return_counts=True)
+    ks = np.asarray(ks)
+    res = []
+    for start in range(0, len(ks), block):
+        k = ks[start:start + block][None, :]
+        F = f[:, None]
+        with np.errstate(invalid='ignore'):
+            logp = (gammaln(L - F + 1) - gammaln(L - F - k + 1)
+                    - gammaln(L + 1) + gammaln(L - k + 1))
+        absent = np.where(k <= L - F, np.exp(logp), 0.)
+        res.append(counts @ (1 - absent))
+    return np.concatenate(res) if res else np.zeros(0)
+
+
+def permutation_richness(matrix, ks, perms=32, seed=1234):
+    '''
+    Number of c_AMPs in the first k samples of `perms` random orders of
+    the samples (rows of matrix), averaged, for every k in ks
+    '''
+    rng = np.random.default_rng(seed)
+    L = matrix.shape[0]
+    ks = np.asarray(ks)
+    total = np.zeros(len(ks))
+    for _ in range(perms):
+        rank = rng.permutation(L)
+        # position at which each c_AMP is first seen
+        first = np.minimum.reduceat(rank[matrix.indices], matrix.indptr[:-1])
+        curve = np.cumsum(np.bincount(first, minlength=L))
+        total += curve[ks - 1]
+    return total / perms
+
+
+def _habitat_curve(args):
+    habitat, matrix, step, method, perms, seed = args
+    ks = np.arange(1, matrix.shape[0] + 1, step)
+    if method == 'analytic':
+        curve = expected_richness(matrix, ks)
+    else:
+        curve = permutation_richness(matrix, ks, perms, seed)
+    return habitat, ks, curve
+
+
+def collector_curves(df, col, habitats, step=10, method='analytic',
+                     perms=32, seed=1234, workers=1):
+    '''
+    Collector's curves of the c_AMPs of each habitat
+
+    :input:
+    - df        dataframe with amp, sample, general_envo_name and `col`
+                columns
+    - col       column with the habitats
+    - habitats  habitats, in the order of the columns of the output
+    - step      curves are calculated for 1, 1 + step, 1 + 2*step, ...
+                samples
+    - method    'analytic' (expected values) or 'permutation' (average of
+                `perms` random orders of the samples)
+    - workers   number of processes (habitats are computed in parallel)
+
+    :output:
+    - dataframe with the number of samples as index (named samples) and
+      the number of c_AMPs of each habitat in the columns
+    '''
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+    if method not in ('analytic', 'permutation'):
+        raise ValueError(f'Unknown method: {method}')
+    matrices = habitat_matrices(df, col, habitats)
+    tasks = [(h, matrices[h], step, method, perms, seed)
+             for h in habitats if h in matrices]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            curves = list(executor.map(_habitat_curve, tasks))
+    else:
+        curves = [_habitat_curve(t) for t in tasks]
+    table = pd.concat([pd.Series(c, index=ks, name=h) for h, ks, c in curves],
+                      axis=1)
+    table.index.name = 'samples'
+    return table
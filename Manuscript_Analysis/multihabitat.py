@@ -0,0 +1,88 @@
+'''
+Permutation test for the number of multi-habitat c_AMPs
+
+The sample x c_AMP incidence is built once as a sparse matrix. A
+permutation shuffles the habitats among samples, which is an array of
+habitat codes: the habitats of each c_AMP are the non-zero entries of
+the product of the (transposed) incidence by the permuted sample x
+habitat one-hot matrix, and c_AMPs with entries in more than one habitat
+are counted. Higher level groupings of habitats are derived from the
+c_AMP x habitat matrix, so every level is computed over the same
+permutation in a single pass over the samples.
+'''
+
+import numpy as np
+
+
+def sample_incidence(df, sample='sample', label='general_envo_name', amp='amp'):
+    '''
+    Sparse (csr) c_AMP x sample matrix (of 0/1), and the label of each
+    sample, from overlap_permutations.sample_matrix
+
+    If a sample has several labels, its last one is used (as with the
+    mapping of samples to habitats of the original test)
+
+    :output:
+    - matrix    c_AMP x sample matrix
+    - codes     label code of each sample
+    - labels    list of labels (sorted)
+    '''
+    from overlap_permutations import sample_matrix
+    last = df.groupby(sample, sort=False)[label].transform('last')
+    matrix, codes, labels = sample_matrix(df.assign(**{label: last}),
+                                          sample, label, amp)
+    return matrix.T.tocsr(), codes, labels
+
+
+def count_multihabitat(matrix, codes, n_labels, groupings, min_habitats=2):
+    '''
+    Number of c_AMPs present in at least `min_habitats` groups, for
+    every grouping of the sample labels
+
+    :input:
+    - matrix        c_AMP x sample matrix
+    - codes         label code of each sample
+    - n_labels      number of labels
+    - groupings     list of (mapping, number of groups), where mapping
+                    gives the group code of each label code
+
+    :output:
+    - list with the number of multi-habitat c_AMPs of each grouping
+    '''
+    from scipy.sparse import csr_matrix
+    onehot = csr_matrix((np.ones(len(codes), dtype=np.int32),
+                         (np.arange(len(codes)), codes)),
+                        shape=(len(codes), n_labels))
+    # c_AMPs x labels
+    per_label = (matrix @ onehot).tocsr()
+    res = []
+    for mapping, g in groupings:
+        grouping = csr_matrix((np.ones(n_labels, dtype=np.int32),
+                               (np.arange(n_labels), mapping)),
+                              shape=(n_labels, g))
+        per_group = (per_label @ grouping).tocsr()
+        res.append(int((np.diff(per_group.indptr) >= min_habitats).sum()))
+    return res
+
+
+def _shuffle_batch(matrix, codes, n_labels, groupings, n, seed):
+    rng = np.random.default_rng(seed)
+    return [count_multihabitat(matrix, rng.permutation(codes), n_labels, groupings)
+            for _ in range(n)]
+
+
+def shuffle_test(matrix, codes, n_labels, groupings, n=100, seed=1234,
+                 workers=1, batch_size=50):
+    '''
+    Number of multi-habitat c_AMPs after shuffling the labels of the
+    samples `n` times, in batches run by overlap_permutations.run_batches
+
+    :output:
+    - array (n, number of groupings) of multi-habitat c_AMPs
+    '''
+    from functools import partial
+    from overlap_permutations import run_batches
+    batches = run_batches(partial(_shuffle_batch, matrix, codes, n_labels, groupings),
+                          n, seed, workers, batch_size)
+    res = [r for b in batches for r in b]
+    return np.array(res, dtype=np.int64).reshape(n, len(groupings))
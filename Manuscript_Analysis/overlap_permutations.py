@@ -0,0 +1,170 @@
+'''
+Permutation engine for the overlap of c_AMPs between habitats
+
+Samples (each sample and habitat label) are encoded once as a sparse
+binary sample x c_AMP matrix. A permutation of the habitat labels is
+an array of group codes: the c_AMPs present in each habitat are obtained
+by OR-aggregating the rows of its samples (scattering the non-zero
+entries of each row into the row of its habitat), and the overlap
+between every pair of habitats by a single product of that presence
+matrix by its transpose. Higher level groupings of habitats are derived
+from the presence per habitat.
+
+Permutations are split into batches processed in parallel, each batch
+with its own random generator spawned from a single seed, so that
+results depend only on the seed and the batch size (not on the number
+of workers).
+'''
+
+import numpy as np
+
+
+def sample_matrix(df, sample='sample', label='general_envo_name', amp='amp'):
+    '''
+    Sparse binary matrix of c_AMPs (columns) in each sample (rows), with
+    the label of each sample
+
+    :input:
+    - df        dataframe with sample, label and amp columns; a sample with
+                several labels makes one row per label
+
+    :output:
+    - matrix    sparse (csr) samples x c_AMPs matrix (of 0/1)
+    - codes     label code of each row
+    - labels    list of labels (sorted)
+    '''
+    import pandas as pd
+    from scipy.sparse import csr_matrix
+    units, _ = pd.factorize(pd.MultiIndex.from_arrays([df[sample], df[label]]))
+    acodes, _ = pd.factorize(df[amp])
+    matrix = csr_matrix((np.ones(len(df), dtype=np.int32), (units, acodes)),
+                        shape=(units.max() + 1, acodes.max() + 1))
+    # duplicated rows were summed up
+    matrix.data[:] = 1
+    labels = sorted(set(df[label]))
+    index = {x: i for i, x in enumerate(labels)}
+    first = np.zeros(matrix.shape[0], dtype=np.int64)
+    first[units] = np.arange(len(units))
+    codes = np.array([index[x] for x in df[label].values[first]])
+    return matrix, codes, labels
+
+
+def presence(matrix, codes, n_groups):
+    '''
+    Presence (0/1) of c_AMPs in each group of samples, where a c_AMP is
+    present in a group if it is present in any of its samples (rows of
+    matrix with that group code; negative codes are ignored)
+
+    The non-zero entries of the sparse matrix are scattered into a
+    dense groups x c_AMPs array, which is an OR over the rows of
+    each group
+
+    :output:
+    - float32 array (groups, c_AMPs)
+    '''
+    group = np.repeat(codes, np.diff(matrix.indptr))
+    keep = group >= 0
+    p = np.zeros((n_groups, matrix.shape[1]), dtype=np.float32)
+    p[group[keep], matrix.indices[keep]] = 1
+    return p
+
+
+def regroup(p, mapping, n_groups):
+    '''
+    Presence of c_AMPs in groups of labels, from their presence in each
+    label (rows of p, with the group code of each in mapping)
+    '''
+    keep = np.flatnonzero(mapping >= 0)
+    indicator = np.zeros((n_groups, len(mapping)), dtype=np.float32)
+    indicator[mapping[keep], keep] = 1
+    return (indicator @ p > 0).astype(np.float32)
+
+
+def cooccurrence(p):
+    '''
+    Number of c_AMPs shared by every pair of rows of a presence array
+    (c_AMPs of each row in the diagonal)
+
+    float32 is exact for counts below 2**24
+    '''
+    return np.rint(p @ p.T).astype(np.int64)
+
+
+def overlaps(matrix, codes, n_groups):
+    '''
+    Number of c_AMPs shared by every pair of groups of samples
+    '''
+    return cooccurrence(presence(matrix, codes, n_groups))
+
+
+def run_batches(fn, n, seed=1234, workers=1, batch_size=100):
+    '''
+    Runs `n` permutations split into batches of `batch_size`, each batch
+    with its own random generator spawned from `seed`, in `workers`
+    processes
+
+    :input:
+    - fn            function of (number of permutations, seed of the
+                    generator of the batch); must be picklable (e.g. a
+                    functools.partial of a module function) if workers > 1
+
+    :output:
+    - list of the results of fn for each batch, in order
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    sizes = [batch_size] * (n // batch_size)
+    if n % batch_size:
+        sizes.append(n % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, sizes, seeds))
+    return [fn(s, ss) for s, ss in zip(sizes, seeds)]
+
+
+def _permutation_batch(matrix, codes, groupings, n, seed):
+    '''
+    Overlaps of `n` permutations of the sample labels, for every
+    grouping (each a mapping of label codes to group codes)
+
+    The presence of c_AMPs per label is computed once per permutation,
+    and aggregated into each grouping
+    '''
+    rng = np.random.default_rng(seed)
+    n_labels = len(groupings[0][0])
+    res = [np.zeros((n, g, g), dtype=np.int64) for _, g in groupings]
+    for k in range(n):
+        p = presence(matrix, rng.permutation(codes), n_labels)
+        for out, (mapping, g) in zip(res, groupings):
+            out[k] = cooccurrence(regroup(p, mapping, g))
+    return res
+
+
+def permuted_overlaps(matrix, codes, groupings, n, seed=1234,
+                      workers=1, batch_size=100):
+    '''
+    Overlaps between groups after shuffling the labels of the samples
+    `n` times
+
+    :input:
+    - matrix        sample x c_AMP matrix from sample_matrix
+    - codes         label code of each sample
+    - groupings     list of (mapping, number of groups), where mapping is
+                    an array giving the group code of each label code (-1
+                    to ignore a label); all groupings are computed over the
+                    same permutations, and all mappings cover every label
+    - n             number of permutations
+    - seed          seed of the random generators
+    - workers       number of processes
+    - batch_size    permutations per batch
+
+    :output:
+    - list with an array (n, groups, groups) of overlaps for each grouping
+    '''
+    from functools import partial
+    batches = run_batches(partial(_permutation_batch, matrix, codes, groupings),
+                          n, seed, workers, batch_size)
+    if not batches:
+        return [np.zeros((0, g, g), dtype=np.int64) for _, g in groupings]
+    return [np.concatenate([b[i] for b in batches])
+            for i in range(len(groupings))]